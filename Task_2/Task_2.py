@@ -1,91 +1,46 @@
 
-import requests
-from gtts import gTTS
 from IPython.display import Audio
-import json
 import os
+import sys
 
-config_path = os.path.join(os.path.dirname(__file__), '..\config.json')
-with open(config_path) as config_file:
-    config = json.load(config_file)
-
-NEWS_API_KEY = config['NEWS_API_KEY']
-NEWS_BASE_URL = config['NEWS_BASE_URL']
-
-WEATHER_API_KEY = config['WEATHER_API_KEY']
-WEATHER_BASE_URL = config['WEATHER_BASE_URL']
-
-QUOTE_BASE_URL = config['QUOTE_BASE_URL']
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import fetchers, scheduler, tts_cache
 
 allText = ''
-def get_random_quote():
-    
-    response = requests.get(QUOTE_BASE_URL)
 
-    if response.status_code == 200:
-        data = response.json()
-        
-        quoteData = data[0]['q']  
-        authorData = data[0]['a'] 
-        quote = quoteData + ' - ' + authorData + '\n'
+# Keeps the quote, weather and news ready in the background while the menu waits for input
+schedule = scheduler.from_config(briefings=False)
+def get_random_quote():
+    quote = fetchers.get_random_quote()
+    if quote:
         print(quote)
-        return quote
-        
-    else:
-        print("Error fetching quote data:", response.status_code)
+    return quote
 
 def get_weather(city, aqi='no'):
-    params = {
-        'key': WEATHER_API_KEY,
-        'q': city,
-        'aqi': aqi
-    }
-    response = requests.get(WEATHER_BASE_URL, params=params)
-
-    if response.status_code == 200:
-        data = response.json()
-        location = data['location']
-        current = data['current']
-        
-        weather = f"Weather: Temperature: {current['temp_c']}°C, Condition: {current['condition']['text']}, Humidity: {current['humidity']}%\n"
+    weather = fetchers.get_weather(city, aqi)
+    if weather:
         print(weather)
-        return weather 
-    else:
-        print("Error fetching weather data:", response.status_code)
-        return ''
+    return weather
 
 def get_top_headlines(country='lv', category='general'):
-    #Params for news
-    params = {
-        'apiKey': NEWS_API_KEY,   
-        'country': country,  
-        'category': category,  
-        'pageSize': 5
-    }
-
-    response = requests.get(NEWS_BASE_URL, params=params)
     print("*********" + country + "  " + category)
-    if response.status_code == 200:
-        data = response.json()
-        articles = data.get('articles', [])
-        
-        if articles:
-            soundOutput = f"Top {category.capitalize()} News Headlines in {country.upper()}:\n"
-            print(f"Top {category.capitalize()} News Headlines in {country.upper()}:\n")
-            news = soundOutput
-            for idx, article in enumerate(articles):
-                if(article['title'] != '[Removed]'):
-                    news = news + article['title']
-                
-                    print(f"{idx + 1}. {article['title']}")
-                    print(f"   Source: {article['source']['name']}")
-                    print(f"   URL: {article['url']}\n")
-                
-        else:
-            print("No news articles found.")
-    else:
-        print(f"Failed to fetch news. Status code: {response.status_code}")
+    news = fetchers.get_top_headlines(country, category)
+    if news:
+        print(news)
     return news
+def precomputed(key):
+    """Shows the scheduler's version of key if there is a fresh one. Returns whether there was."""
+    artifact = schedule.get(key) if schedule else None
+    if artifact:
+        print(artifact["text"])
+        print("Saved audio to", artifact["audio_path"])
+    return artifact is not None
+
+def speak(text):
+    audio_path = tts_cache.save_speech(text)
+    if audio_path:
+        print("Saved audio to", audio_path)
+
 def display_menu():
     """
     Menu choices to the user.
@@ -98,26 +53,33 @@ def display_menu():
     print("===================")
 
 def main():
+    if schedule:
+        schedule.start()
     while True:
         display_menu()
         
         choice = input("Please choose an option (1-4): ")
 
         if choice == '1':
-            quote = get_random_quote()
-            tts = gTTS(quote)
-            tts.save("output.mp3")
+            if not precomputed(("quote",)):
+                quote = get_random_quote()
+                if quote:
+                    speak(quote)
         elif choice == '2':
-            weather = get_weather('Latvia')
-            if(weather!=''):
-                tts = gTTS(weather)
-                tts.save("output.mp3")
+            if not precomputed(("weather", 'Latvia')):
+                weather = get_weather('Latvia')
+                if(weather!=''):
+                    speak(weather)
         elif choice == '3':
-            news =  get_top_headlines(country='us', category='general')
-            tts = gTTS(news)
-            tts.save("output.mp3")
+            if not precomputed(("news", 'us', 'general')):
+                news =  get_top_headlines(country='us', category='general')
+                if news:
+                    speak(news)
         elif choice == '4':
             print("Exiting the program. Goodbye!")
+            # drops queued refreshes, so exiting does not wait for them
+            if schedule:
+                schedule.stop()
             break  # Exit the loop and end the program
         else:
             print("Invalid choice. Please choose a number between 1 and 4.")
@@ -3,7 +3,11 @@ import openai
 import random
 import os
 import time
-import requests
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.tool_runner import ToolRunner
+from common.tools import shared_tools
 
 # Set your OpenAI API key
 # this key has auto-charge disabled, no billing methog assigned, and 5$ in API credits.
@@ -13,77 +17,26 @@ config_path = os.path.join(os.path.dirname(__file__), '..\config.json')
 with open(config_path) as config_file:
     config = json.load(config_file)
 
-NEWS_API_KEY = config['NEWS_API_KEY']
-NEWS_BASE_URL = config['NEWS_BASE_URL']
+openai.api_key = config['OPEN_API_KEY']
 
-QUOTE_BASE_URL = config['QUOTE_BASE_URL']
 
-openai.api_key = config['OPEN_API_KEY']
+# Define the custom tools, the quote and news tools come from common/tools.py
+registry = shared_tools.copy()
+
+# Define the tool functions
+@registry.tool
+def return_string():
+    """Returns a random text string"""
+    return ''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=5))
+
+@registry.tool
+def return_integer():
+    """Returns an integer from 0 to 9"""
+    return random.randint(0, 9)
 
+tools = registry.schemas()
 
-# Define the custom tools
-tools = [
-    {
-        "type": "function",
-        "function": {
-            "name": "return_string",
-            "description": "Returns a random text string",
-            "parameters": {
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "return_integer",
-            "description": "Returns an integer from 0 to 9",
-            "parameters": {
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_random_quote",
-            "description": "Fetches a random quote and author",
-            "parameters": {
-                "type": "object",
-                "properties": {},
-                "required": []
-            }
-        }
-    },
-    {
-    "type": "function",
-    "function": {
-        "name": "get_top_headlines",
-        "description": "Fetches the top news headlines for a given country and category.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "country": {
-                    "type": "string",
-                    "description": "The 2-letter country code (ISO 3166-1) for which you want to get the news headlines.",
-                    "default": "us"
-                },
-                "category": {
-                    "type": "string",
-                    "description": "The category of news to fetch, such as 'general', 'business', 'entertainment', 'health', 'science', 'sports', or 'technology'. Default is 'general'.",
-                    "enum": ["general", "business", "entertainment", "health", "science", "sports", "technology"],
-                    "default": "general"
-                }
-            },
-            "required": []
-        }
-    }
-    }
-]
+tool_runner = ToolRunner(registry)
 
 # 40-mini is the cheapest one.
 assistant = openai.beta.assistants.create(
@@ -95,53 +48,6 @@ assistant = openai.beta.assistants.create(
 
 print(f"Assistant created with ID: {assistant.id}")
 
-# Define the tool functions
-def return_string():
-    return ''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=5))
-
-def return_integer():
-    return random.randint(0, 9)
-
-# add your own functions
-def get_random_quote():
-    
-    response = requests.get(QUOTE_BASE_URL)
-
-    if response.status_code == 200:
-        data = response.json()
-        
-        quoteData = data[0]['q']  
-        authorData = data[0]['a'] 
-        quote = quoteData + ' - ' + authorData + '\n'
-        print(quote)
-        return quote
-    
-def get_top_headlines(country='us', category='general'):
-    #Params for news
-    params = {
-        'apiKey': NEWS_API_KEY,   
-        'country': country,  
-        'category': category,  
-        'pageSize': 5
-    }
-
-    response = requests.get(NEWS_BASE_URL, params=params)
-    if response.status_code == 200:
-        data = response.json()
-        articles = data.get('articles', [])
-        
-        if articles:
-            news= f"Top {category.capitalize()} News Headlines in {country.upper()}:\n"
-            for idx, article in enumerate(articles):
-                if(article['title'] != '[Removed]'):
-                    news = news + article['title']
-                
-        else:
-            return "No news articles found."
-    else:
-        print(f"Failed to fetch news. Status code: {response.status_code}")
-    return news
-
 # Create a conversation thread
 thread = openai.beta.threads.create()
 print(f"Thread created with ID: {thread.id}")
@@ -194,20 +100,7 @@ if run.status == "requires_action":
     if run.required_action:
         for tool_call in run.required_action.submit_tool_outputs.tool_calls:
             
-            if tool_call.function.name == "return_string":
-                print("  return_string called")
-                output = return_string()
-            elif tool_call.function.name == "return_integer":
-                print("  return_integer called")
-                output = return_integer()
-            elif tool_call.function.name == "get_random_quote":
-                print("  get_random_quote called")
-                output = get_random_quote()
-            elif tool_call.function.name == "get_top_headlines":
-                print("  get_top_headlines called")
-                output = get_top_headlines()
-            else:
-                print("Unknown function call")
+            output = tool_runner.execute(tool_call)
             print(f"  Generated output: {output}")
 
             # submit the output back to assistant
@@ -0,0 +1,143 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+import metrics
+
+
+class Rejected(Exception):
+    """The request was not admitted. status_code is 429 or 503, retry_after is in seconds."""
+
+    def __init__(self, status_code, reason, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """rate tokens per second, at most burst of them saved up."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Takes a token. Returns 0 on success, otherwise the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionControl:
+    """Decides whether a request may start, so overload is shed quickly instead of
+    every request timing out.
+
+    A client that has used up its token bucket gets 429. Otherwise the request
+    runs if fewer than max_in_flight are running, or waits in a FIFO of at most
+    max_queue requests for up to queue_timeout seconds, and gets 503 when the
+    queue is full or the wait is over. Both come with a Retry-After.
+
+    Only used from the event loop, so no locks.
+    """
+
+    def __init__(self, max_in_flight=8, max_queue=16, queue_timeout=2.0, rate=0.5, burst=10,
+                 retry_after=2, max_clients=10000):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+        self.retry_after = retry_after
+        self.max_clients = max_clients
+        self.in_flight = 0
+        # futures of the waiting requests, first come first served
+        self._waiting = deque()
+        # client -> TokenBucket, least recently seen first
+        self._buckets = OrderedDict()
+
+    def _reject(self, status_code, reason, detail, retry_after):
+        metrics.admission_rejected.inc(reason=reason)
+        raise Rejected(status_code, reason, detail, retry_after)
+
+    def check_rate(self, client):
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        wait = bucket.take()
+        if wait:
+            self._reject(429, "rate_limited", "Too many messages, slow down", math.ceil(wait))
+
+    async def acquire(self, client):
+        """Waits for an in-flight slot, raising Rejected when there is none to be had.
+        Every successful acquire() needs exactly one release()."""
+        self.check_rate(client)
+        if self.in_flight < self.max_in_flight and not self._waiting:
+            self.in_flight += 1
+            return
+        if len(self._waiting) >= self.max_queue:
+            self._reject(503, "queue_full", "Server is busy, try again shortly", self.retry_after)
+
+        slot = asyncio.get_running_loop().create_future()
+        self._waiting.append(slot)
+        try:
+            await asyncio.wait_for(asyncio.shield(slot), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if slot.done():
+                # the slot was handed over just as we gave up, pass it on
+                self.release()
+            else:
+                self._waiting.remove(slot)
+                slot.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject(503, "queue_timeout", "Server is busy, try again shortly", self.retry_after)
+
+    def release(self):
+        # a finished request hands its slot straight to the next waiting one
+        while self._waiting:
+            slot = self._waiting.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def samples(self):
+        """Gauges for /metrics, see metrics.collectors."""
+        return [
+            ("admission_in_flight", "gauge", "Admitted requests that have not finished",
+             [("admission_in_flight", "", self.in_flight)]),
+            ("admission_queue_depth", "gauge", "Requests waiting for an in-flight slot",
+             [("admission_queue_depth", "", len(self._waiting))]),
+        ]
+
+
+def from_config(config):
+    """AdmissionControl for the "admission" section of config.json, or None if it is disabled.
+
+    {"max_in_flight": 8, "max_queue": 16, "queue_timeout_seconds": 2,
+     "messages_per_minute": 30, "burst": 10, "retry_after_seconds": 2}
+    """
+    settings = config.get("admission", {})
+    if not settings.get("enabled", True):
+        return None
+    return AdmissionControl(
+        max_in_flight=settings.get("max_in_flight", 8),
+        max_queue=settings.get("max_queue", 16),
+        queue_timeout=settings.get("queue_timeout_seconds", 2),
+        rate=settings.get("messages_per_minute", 30) / 60,
+        burst=settings.get("burst", 10),
+        retry_after=settings.get("retry_after_seconds", 2),
+    )
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import assistant
+import metrics
+import run_engine
+
+# Rounds of tool calls a Chat Completions answer may take before we stop asking
+MAX_TOOL_ROUNDS = 5
+
+
+class AssistantsBackend:
+    """The Assistants API: the messages go on an OpenAI thread and a run answers them."""
+
+    name = "assistants"
+    # runs need the remote assistant, and a thread that may be rotated
+    needs_assistant = True
+    uses_threads = True
+
+    async def respond(self, thread_id, messages):
+        return await run_engine.interact_with_assistant(thread_id, messages)
+
+    def stream(self, thread_id, message):
+        return run_engine.stream_assistant(thread_id, message)
+
+
+def tool_call_namespace(call_id, name, arguments):
+    """Something that looks like an API tool call, for run_engine.run_tool_call."""
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def tool_call_messages(content, tool_calls, outputs):
+    """The assistant message asking for tool_calls and the tool messages answering it."""
+    request = {
+        "role": "assistant",
+        "content": content,
+        "tool_calls": [
+            {"id": call.id, "type": "function",
+             "function": {"name": call.function.name, "arguments": call.function.arguments}}
+            for call in tool_calls
+        ],
+    }
+    return [request] + [
+        {"role": "tool", "tool_call_id": output["tool_call_id"], "content": output["output"]} for output in outputs
+    ]
+
+
+class ChatCompletionsBackend:
+    """Chat Completions with tool calling: one request per answer (plus one per round of
+    tool calls), no runs and no polling.
+
+    The context is the conversation's recent history from message-history.db, so
+    the user messages must be saved (or queued on the writer) before respond()
+    is called, as the run queue does.
+    """
+
+    name = "chat"
+    needs_assistant = False
+    uses_threads = False
+
+    def __init__(self, db, writer, model=assistant.ASSISTANT_MODEL, history_messages=20):
+        self.db = db
+        self.writer = writer
+        self.model = model
+        self.history_messages = history_messages
+
+    async def context(self, conversation_id):
+        await self.writer.flush()
+        rows, _ = await self.db.get_messages(conversation_id, self.history_messages)
+        return [{"role": "system", "content": assistant.ASSISTANT_INSTRUCTIONS}] + [
+            {"role": role, "content": content} for _, role, content, _ in rows
+        ]
+
+    async def complete(self, messages, **kwargs):
+        return await run_engine.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            tools=assistant.tools,
+            **kwargs
+        )
+
+    async def respond(self, conversation_id, messages):
+        started = time.perf_counter()
+        context = await self.context(conversation_id)
+        tools_used = set()
+        status = "completed"
+        try:
+            for _ in range(MAX_TOOL_ROUNDS + 1):
+                with metrics.stage_seconds.time(stage="chat_completion"):
+                    completion = await self.complete(context)
+                message = completion.choices[0].message
+                if not message.tool_calls:
+                    return {"response": message.content, "thread_id": conversation_id, "tools": sorted(tools_used)}
+
+                tools_used.update(call.function.name for call in message.tool_calls)
+                with metrics.stage_seconds.time(stage="tools"):
+                    outputs = await asyncio.gather(*(run_engine.run_tool_call(call) for call in message.tool_calls))
+                context += tool_call_messages(message.content, message.tool_calls, outputs)
+
+            print(f"Conversation {conversation_id}: still calling tools after {MAX_TOOL_ROUNDS} rounds, giving up")
+            status = "incomplete"
+            return {"response": None, "thread_id": conversation_id, "tools": sorted(tools_used)}
+        except asyncio.CancelledError:
+            status = "disconnected"
+            raise
+        finally:
+            metrics.run_seconds.observe(time.perf_counter() - started, mode="chat", status=status)
+
+    async def stream(self, conversation_id, message):
+        """Same events as run_engine.stream_assistant."""
+        started = time.perf_counter()
+        context = await self.context(conversation_id)
+        answer_parts = []
+        yield "run", {"run_id": None, "status": "in_progress"}
+
+        for _ in range(MAX_TOOL_ROUNDS + 1):
+            stream = await self.complete(context, stream=True)
+            # index -> [id, name, arguments], tool calls arrive in pieces
+            calls = {}
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        if not answer_parts:
+                            metrics.stage_seconds.observe(time.perf_counter() - started, stage="first_token")
+                        answer_parts.append(delta.content)
+                        yield "delta", {"text": delta.content}
+                    for piece in delta.tool_calls or []:
+                        call = calls.setdefault(piece.index, ["", "", ""])
+                        if piece.id:
+                            call[0] = piece.id
+                        if piece.function and piece.function.name:
+                            call[1] = piece.function.name
+                            yield "tool_call", {"name": call[1], "status": "requested"}
+                        if piece.function and piece.function.arguments:
+                            call[2] += piece.function.arguments
+            finally:
+                await stream.close()
+
+            if not calls:
+                metrics.run_seconds.observe(time.perf_counter() - started, mode="chat", status="completed")
+                yield "done", {"response": "".join(answer_parts), "thread_id": conversation_id}
+                return
+
+            tool_calls = [tool_call_namespace(*calls[index]) for index in sorted(calls)]
+            for call in tool_calls:
+                yield "tool_call", {"name": call.function.name, "status": "running"}
+            outputs = await asyncio.gather(*(run_engine.run_tool_call(call) for call in tool_calls))
+            for call in tool_calls:
+                yield "tool_call", {"name": call.function.name, "status": "completed"}
+            context += tool_call_messages("".join(answer_parts) or None, tool_calls, outputs)
+            answer_parts = []
+
+        metrics.run_seconds.observe(time.perf_counter() - started, mode="chat", status="incomplete")
+        yield "error", {"status": "incomplete", "message": f"Still calling tools after {MAX_TOOL_ROUNDS} rounds"}
+
+
+def from_config(config, db, writer):
+    """The backend named by "backend" in config.json: "assistants" (the default) or "chat"."""
+    name = config.get("backend", "assistants")
+    if name == "assistants":
+        return AssistantsBackend()
+    if name == "chat":
+        return ChatCompletionsBackend(
+            db,
+            writer,
+            model=config.get("chat_model", assistant.ASSISTANT_MODEL),
+            history_messages=config.get("chat_history_messages", 20),
+        )
+    raise ValueError(f"Unknown backend {name!r} in config.json, use 'assistants' or 'chat'")
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import re
+import time
+
+from common import briefing, scheduler, tts_cache
+
+# Finished briefings, next to the segment cache so they count towards its size cap
+BRIEFING_DIR = os.path.join(tts_cache.CACHE_DIR, "briefings")
+
+CHUNK_SIZE = 64 * 1024
+
+# (city, country, category) -> path of the last briefing that was completely synthesized
+latest_briefings = {}
+
+# Pre-computes the configured briefings in the background, started by the app
+schedule = scheduler.from_config()
+
+
+def finished_briefing(city, country, category):
+    """Path of the newest finished briefing, streamed here or pre-computed by the scheduler, or None."""
+    candidates = [latest_briefings.get((city, country, category))]
+    artifact = schedule.get(("briefing", city, country, category)) if schedule else None
+    if artifact:
+        candidates.append(artifact["audio_path"])
+    newest = None
+    for path in candidates:
+        try:
+            modified = os.path.getmtime(path) if path else None
+        except FileNotFoundError:
+            # evicted from the audio cache
+            continue
+        if modified is not None and (newest is None or modified > newest[0]):
+            newest = (modified, path)
+    return newest[1] if newest else None
+
+
+async def read_file(path, start=0, end=None):
+    """Yields the bytes of path from start up to and including end, one chunk at a time."""
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            chunk = await asyncio.to_thread(file.read, size)
+            if not chunk:
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+async def synthesize(segment):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(tts_cache.synthesis_executor, tts_cache.synthesize_segment, segment)
+
+
+async def section_text(futures, name, started):
+    """One section's text, or None when the source is late or failing (the briefing goes on without it)."""
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(futures[name]), briefing.time_left(name, started))
+    except asyncio.TimeoutError:
+        print(f"Briefing: {name} did not arrive in time, skipping it")
+    except Exception as e:
+        print(f"Briefing: {name} failed, skipping it: {e}")
+    return None
+
+
+async def section_audio(futures, name, started, pending):
+    """Waits for one section's text and starts synthesizing all its segments right away.
+    Returns (segment, future of its audio path) pairs; the futures are also added to pending."""
+    text = await section_text(futures, name, started)
+    section_segments = tts_cache.split_segments(text or "")
+    synthesis = [asyncio.ensure_future(synthesize(segment)) for segment in section_segments]
+    pending.extend(synthesis)
+    return list(zip(section_segments, synthesis))
+
+
+async def stream_briefing(city, country, category):
+    """Yields the MP3 of a quote, weather and headlines briefing while it is synthesized.
+
+    All three texts are fetched at once and every segment is synthesized as soon as
+    its text is known, but the audio goes out in order: the quote can play while
+    the headlines are still being synthesized. The finished briefing is saved for
+    /briefing-audio/latest.
+    """
+    started = time.monotonic()
+    futures = briefing.start_sections(city, country, category)
+    # every section is fetched and synthesized in its own task, against its own deadline;
+    # only the audio is sent in order
+    pending = []
+    sections = [asyncio.ensure_future(section_audio(futures, name, started, pending)) for name in briefing.SECTIONS]
+    segments = []
+    paths = []
+    try:
+        for section in sections:
+            for segment, future in await section:
+                path = await future
+                data = await asyncio.to_thread(read_segment, path)
+                yield data if not paths else tts_cache.strip_id3(data)
+                segments.append(segment)
+                paths.append(path)
+    finally:
+        for future in futures.values():
+            future.cancel()
+        for task in sections + pending:
+            task.cancel()
+
+    if paths:
+        key = (city, country, category)
+        output_path = tts_cache.speech_path(segments, BRIEFING_DIR)
+        latest_briefings[key] = await asyncio.to_thread(tts_cache.assemble, paths, output_path)
+
+
+def read_segment(path):
+    # segments are a few kilobytes each
+    with open(path, "rb") as file:
+        return file.read()
+
+
+# One "bytes=first-last", "bytes=first-" or "bytes=-suffix" range
+SINGLE_RANGE = re.compile(r"bytes=(\d+-\d*|-\d+)")
+
+
+def is_single_range(header):
+    """Whether header is one byte range. Anything else (several ranges, other units) may be
+    ignored and answered with the whole file (RFC 9110)."""
+    return SINGLE_RANGE.fullmatch(header.strip()) is not None
+
+
+def parse_range(header, size):
+    """Returns (start, end) for a single "bytes=" range, or None if it can not be satisfied."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not is_single_range(header) or not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # "bytes=-500" is the last 500 bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
@@ -1,9 +1,25 @@
+import asyncio
 import json
 import os
-import sqlite3
-from fastapi import FastAPI
+import sys
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+
+# The app modules import from common/ in the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+import admission
 import assistant
+import backends
+import briefing_audio
+import metrics
+import response_cache
+import run_engine
+import run_queue
+import storage
+import thread_manager
+from common import cache
 from fastapi.middleware.cors import CORSMiddleware
 
 origins = [
@@ -25,7 +41,92 @@ thread_id = config["thread_id"]
 if not thread_id:
     raise ValueError("Thread ID not found in config.json. Please ensure it is properly initialized.")
 
-app = FastAPI()
+# Message history storage, opened and closed together with the app
+db = storage.Storage()
+
+# Messages are saved in the background, batched into one transaction per few milliseconds
+writer = storage.MessageWriter(db)
+
+# What answers the messages: "backend": "assistants" (default) or "chat" in config.json
+backend = backends.from_config(config, db, writer)
+
+# Moves the conversation to a fresh OpenAI thread, seeded with a summary, once the current one is long.
+# "thread_rotation": {"max_messages": 40, "max_tokens": 8000, "summary_chars": 2000}, or {"enabled": false}
+rotation_settings = config.get("thread_rotation", {})
+threads = None
+if backend.uses_threads and rotation_settings.get("enabled", True):
+    threads = thread_manager.ThreadManager(
+        db,
+        writer,
+        max_messages=rotation_settings.get("max_messages", 40),
+        max_tokens=rotation_settings.get("max_tokens", 8000),
+        summary_chars=rotation_settings.get("summary_chars", 2000),
+    )
+
+# One active run per conversation, everything else waits its turn
+runs = run_queue.RunQueue(backend, writer, threads)
+
+# Opt-in: answers to repeated messages are served without a run while the data they used is unchanged.
+# "response_cache": {"enabled": true, "maxsize": 256, "ttl": 3600} in config.json
+response_cache_settings = config.get("response_cache", {})
+responses = None
+if response_cache_settings.get("enabled", False):
+    responses = response_cache.ResponseCache(
+        assistant.registry,
+        maxsize=response_cache_settings.get("maxsize", 256),
+        ttl=response_cache_settings.get("ttl", 3600),
+    )
+
+# Sheds load instead of letting every request time out: a limit on messages being answered at once,
+# a short wait queue and a token bucket per client. "admission": {"max_in_flight": 8, "max_queue": 16,
+# "queue_timeout_seconds": 2, "messages_per_minute": 30, "burst": 10}, or {"enabled": false}
+admissions = admission.from_config(config)
+if admissions:
+    metrics.collectors.append(admissions.samples)
+
+# Behind ngrok or another proxy every request comes from the proxy, the real client is in X-Forwarded-For
+trust_forwarded_for = config.get("admission", {}).get("trust_forwarded_for", False)
+
+# Set once the remote assistant is known, see /ready
+ready = asyncio.Event()
+
+async def initialize_assistant():
+    """Looks up (or creates) the remote assistant in the background, retrying until it works."""
+    delay = 1
+    while True:
+        try:
+            await asyncio.to_thread(assistant.get_assistant)
+            ready.set()
+            return
+        except Exception as e:
+            print(f"Assistant initialization failed, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db.open()
+    writer.start()
+    # the app starts serving right away, /ready reports when the assistant is usable
+    if backend.needs_assistant:
+        init_task = asyncio.create_task(initialize_assistant())
+    else:
+        init_task = None
+        ready.set()
+    if briefing_audio.schedule:
+        briefing_audio.schedule.start()
+    yield
+    if briefing_audio.schedule:
+        briefing_audio.schedule.stop()
+    if init_task is not None:
+        init_task.cancel()
+    await runs.close()
+    # everything accepted before shutdown is committed before the database closes
+    await writer.close()
+    db.close()
+    await run_engine.client.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,65 +136,262 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Plain ASGI, so request.is_disconnected() still sees clients leaving, see metrics.RequestTimer
+app.add_middleware(metrics.RequestTimer)
+
+async def require_ready():
+    if not ready.is_set():
+        raise HTTPException(status_code=503, detail="Assistant is starting up", headers={"Retry-After": "1"})
+
+# Readiness probe for load balancers and process managers
+@app.get("/ready")
+async def readiness():
+    await require_ready()
+    if not backend.needs_assistant:
+        return {"status": "ready", "backend": backend.name}
+    return {"status": "ready", "backend": backend.name, "assistant_id": assistant.assistant.id}
+
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_CHECK_INTERVAL = 0.5
+
+async def run_until_disconnected(request: Request, coro):
+    """Awaits coro, cancelling it if the client disconnects first. Returns None on disconnect."""
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_CHECK_INTERVAL)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return None
+
+def client_id(request: Request):
+    if trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def admit(request: Request):
+    """Takes an in-flight slot for the request, or answers 429/503 with Retry-After right away."""
+    try:
+        await admissions.acquire(client_id(request))
+    except admission.Rejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+async def admit_message(request: Request):
+    """Holds an in-flight slot for the whole request."""
+    if admissions is None:
+        yield
+        return
+    await admit(request)
+    try:
+        yield
+    finally:
+        admissions.release()
+
 # Model for a single message
 class Message(BaseModel):
     role: str
     content: str
 
 # Receive a dummy message and return a test response from the virtual assistant
-@app.post("/send-message/")
-async def process_message_and_respond(message: str):
-    connection = sqlite3.connect("message-history.db")
-    cursor = connection.cursor()
+@app.post("/send-message/", dependencies=[Depends(require_ready), Depends(admit_message)])
+async def process_message_and_respond(message: str, request: Request):
     print("AAAAAA = ", message)
-    # Save user message to the database
-    cursor.execute('''
-        INSERT INTO messages (thread_id, role, content)
-        VALUES (?, ?, ?)
-    ''', (thread_id, "user", message))
-
-    # Get the assistant's response
-    a_response = assistant.interact_with_assistant(message)
-    response_message = a_response["response"]
 
-    # Save the assistant's response to the database
-    cursor.execute('''
-        INSERT INTO messages (thread_id, role, content)
-        VALUES (?, ?, ?)
-    ''', (thread_id, "assistant", response_message))
+    cached_response = responses.lookup(thread_id, message) if responses else None
+    if cached_response is not None:
+        # Save both messages to the database; a run saves its own when it starts and completes
+        writer.add(thread_id, "user", message)
+        writer.add(thread_id, "assistant", cached_response)
+        return {
+            "thread_id": thread_id,
+            "response": cached_response,
+            "message_received": message,
+            "queue_position": 0,
+            "batch_size": 1,
+            "cached": True
+        }
+    snapshot = responses.snapshot() if responses else None
+
+    # Wait for our turn on the thread; messages queued together share one run, which saves them and its answer
+    job = runs.submit(thread_id, message)
+    a_response = await run_until_disconnected(request, job.result())
+    if a_response is None:
+        # client closed the request, nobody is listening for the answer
+        return Response(status_code=499)
+    response_message = a_response["response"]
+    if response_message is None:
+        raise HTTPException(status_code=502, detail="The assistant run did not complete")
 
-    # Commit changes and close the connection
-    connection.commit()
-    connection.close()
+    # an answer to several coalesced messages is not the answer to this one alone
+    if responses and a_response["batch_size"] == 1:
+        responses.store(thread_id, message, a_response, snapshot)
     
     return {
         "thread_id": thread_id,
         "response": response_message,
-        "message_received": message
+        "message_received": message,
+        "queue_position": job.position,
+        "batch_size": a_response["batch_size"],
+        "cached": False
     }
 
-# Retrieve a conversation history based on the thread ID, 5 messages from the user, 5 from the assistant
+def sse_event(event, data):
+    """Formats one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Same as /send-message/, but streams the answer as Server-Sent Events while it is generated
+@app.api_route("/send-message-stream/", methods=["GET", "POST"], dependencies=[Depends(require_ready)])
+async def stream_message_and_respond(message: str, request: Request):
+    if admissions:
+        await admit(request)
+
+    job = runs.submit(thread_id, message, stream=True)
+    if admissions:
+        # held until the run is over, not just until the response starts
+        job.future.add_done_callback(lambda _: admissions.release())
 
+    async def event_stream():
+        yield sse_event("queued", {"queue_position": job.position})
+        # the run queue saves the message and the answer, even if the client leaves before "done"
+        async for event, data in job.iter_events():
+            yield sse_event(event, data)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Whether a run is active on the thread and how many messages are waiting for it
+@app.get("/queue-status/")
+async def queue_status(thread_id: str):
+    return runs.status(thread_id)
+
+# Retrieve a page of conversation history for a thread, oldest message first.
+# Without a cursor this is the newest `limit` messages; pass next_cursor back as
+# before_id (or as after_id when paging forward) to get the next page.
 @app.get("/conversation-history/")
-async def conversation_history(thread_id: str):
-    connection = sqlite3.connect("message-history.db")
-    cursor = connection.cursor()
-
-    # Fetch messages from the database
-    cursor.execute('''
-        SELECT role, content FROM messages
-        WHERE thread_id = ?
-        ORDER BY created_at ASC
-    ''', (thread_id,))
-    rows = cursor.fetchall()
-    print(rows)
+async def conversation_history(
+    thread_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before_id: int | None = None,
+    after_id: int | None = None,
+):
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or after_id, not both")
+
+    # Fetch messages from the database, including the ones still queued for writing
+    await writer.flush()
+    rows, has_more = await db.get_messages(thread_id, limit, before_id, after_id)
     # Format the conversation history
-    conversation_history = [{"sender": row[0], "content": row[1]} for row in rows]
-    
-    connection.commit()
-    connection.close()
+    conversation_history = [
+        {"id": row[0], "sender": row[1], "content": row[2], "created_at": row[3]}
+        for row in rows
+    ]
+
+    next_cursor = None
+    if has_more and rows:
+        # newest row when paging forward, oldest row otherwise
+        next_cursor = rows[-1][0] if after_id is not None else rows[0][0]
 
     return {
         "thread_id": thread_id,
-        "conversation_history": conversation_history
+        "conversation_history": conversation_history,
+        "next_cursor": next_cursor
     }
+
+# Full-text search over all stored messages, best match first. Every word of q has
+# to match (as a prefix); thread_id and role narrow the search down. Pass
+# next_offset back as offset to get the next page.
+@app.get("/search-messages/")
+async def search_messages(
+    q: str = Query(..., min_length=1),
+    thread_id: str | None = None,
+    role: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    await writer.flush()
+    rows, has_more = await db.search_messages(q, thread_id, role, limit, offset)
+    results = [
+        {
+            "id": row[0],
+            "thread_id": row[1],
+            "sender": row[2],
+            "created_at": row[3],
+            "snippet": row[4],
+            "score": -row[5],
+        }
+        for row in rows
+    ]
+    return {
+        "query": q,
+        "results": results,
+        "next_offset": offset + len(rows) if has_more else None
+    }
+
+# Spoken briefing (quote, weather, headlines) as audio/mpeg. A briefing pre-computed by the
+# scheduler is sent right away, otherwise it is sent segment by segment while it is
+# synthesized, so playback can start before the whole briefing is done
+@app.get("/briefing-audio/")
+async def briefing_audio_stream(city: str = "Liepaja", country: str = "us", category: str = "general"):
+    artifact = briefing_audio.schedule.get(("briefing", city, country, category)) if briefing_audio.schedule else None
+    if artifact and os.path.exists(artifact["audio_path"]):
+        return StreamingResponse(
+            briefing_audio.read_file(artifact["audio_path"]),
+            media_type="audio/mpeg",
+            headers={"Cache-Control": "no-cache"},
+        )
+    return StreamingResponse(
+        briefing_audio.stream_briefing(city, country, category),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# The last completely synthesized briefing for these parameters, with Range support for seeking
+@app.get("/briefing-audio/latest")
+async def briefing_audio_latest(
+    request: Request, city: str = "Liepaja", country: str = "us", category: str = "general"
+):
+    path = briefing_audio.finished_briefing(city, country, category)
+    try:
+        size = os.path.getsize(path) if path else None
+    except FileNotFoundError:
+        # evicted from the audio cache in the meantime
+        size = None
+    if size is None:
+        raise HTTPException(status_code=404, detail="No finished briefing yet, use /briefing-audio/")
+
+    headers = {"Accept-Ranges": "bytes"}
+    range_header = request.headers.get("range")
+    if range_header is None or not briefing_audio.is_single_range(range_header):
+        # several ranges are allowed to be ignored, the whole file is a valid answer
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(briefing_audio.read_file(path), media_type="audio/mpeg", headers=headers)
+
+    byte_range = briefing_audio.parse_range(range_header, size)
+    if byte_range is None:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        briefing_audio.read_file(path, start, end), status_code=206, media_type="audio/mpeg", headers=headers
+    )
+
+# Stage, tool, database and request latencies plus the cache counters, for Prometheus to scrape
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Hit/miss counters of the quote and news caches, and of the response cache when enabled
+@app.get("/cache-stats/")
+async def cache_stats():
+    return cache.stats()
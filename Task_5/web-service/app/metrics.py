@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from common import cache, tool_registry
+
+# Seconds, from a fast SQLite query to a slow assistant run
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Every metric made below, in the order they are rendered on /metrics
+metrics = []
+
+
+def format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, per label combination.
+
+    observe() is a bisect and three additions under a lock, cheap enough for
+    every query and poll.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (the last one is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the with block took, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", format_labels(self.labelnames, key, [("le", format_value(bound))]), cumulative
+            yield self.name + "_sum", format_labels(self.labelnames, key), total
+            yield self.name + "_count", format_labels(self.labelnames, key), count
+
+
+class Counter:
+    """A count that only goes up, per label combination."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, format_labels(self.labelnames, key), value
+
+
+class RequestTimer:
+    """ASGI middleware observing http_seconds when the response headers are sent.
+
+    Not @app.middleware("http"): Starlette's BaseHTTPMiddleware keeps the client's
+    disconnect from reaching request.is_disconnected(), which the endpoints rely
+    on to cancel runs nobody waits for. Messages pass through unchanged.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                # the route template, set on the scope by the router, so the labels stay bounded
+                route = scope.get("route")
+                http_seconds.observe(
+                    time.perf_counter() - started,
+                    method=scope["method"],
+                    route=route.path if route is not None else "unmatched",
+                    status=str(message["status"]),
+                )
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+# Extra samples computed when /metrics is scraped: functions returning (name, type, help, samples)
+collectors = []
+
+
+def cache_samples():
+    """The counters of the fetcher caches, the same numbers as /cache-stats/."""
+    stats = cache.stats()
+    families = []
+    for event in ("hits", "stale_hits", "misses", "refreshes", "evictions"):
+        name = f"cache_{event}_total"
+        samples = [(name, format_labels(("cache",), (cache_name,)), values[event]) for cache_name, values in stats.items()]
+        families.append((name, "counter", f"Cache {event.replace('_', ' ')}", samples))
+    samples = [("cache_size", format_labels(("cache",), (cache_name,)), values["size"]) for cache_name, values in stats.items()]
+    families.append(("cache_size", "gauge", "Entries in the cache", samples))
+    return families
+
+
+collectors.append(cache_samples)
+
+
+def flight_samples():
+    """Calls of single-flight tools (quote, news) that ran, and those that joined an identical call already running."""
+    stats = tool_registry.flights.stats()
+    return [
+        ("tool_calls_started_total", "counter", "Calls of single-flight tools that ran",
+         [("tool_calls_started_total", "", stats["calls"])]),
+        ("tool_calls_shared_total", "counter", "Calls of single-flight tools that waited for an identical call instead",
+         [("tool_calls_shared_total", "", stats["shared"])]),
+    ]
+
+
+collectors.append(flight_samples)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    families = [(metric.name, metric.type, metric.help, metric.samples()) for metric in metrics]
+    for collector in collectors:
+        families.extend(collector())
+    for name, type, help, samples in families:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {type}")
+        for sample_name, labels, value in samples:
+            lines.append(f"{sample_name}{labels} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Where the time of a /send-message/ goes
+stage_seconds = Histogram(
+    "assistant_stage_seconds",
+    "Time spent in each stage of an assistant run",
+    ["stage"],
+)
+poll_iterations = Histogram(
+    "assistant_poll_iterations",
+    "runs.retrieve calls needed until a run finished or asked for a tool",
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+tool_seconds = Histogram(
+    "assistant_tool_seconds",
+    "Duration of tool calls",
+    ["tool", "outcome"],
+)
+run_seconds = Histogram(
+    "assistant_run_seconds",
+    "Duration of whole assistant runs, from adding the message to the answer",
+    ["mode", "status"],
+)
+db_seconds = Histogram(
+    "db_query_seconds",
+    "Duration of message history queries, including the commit",
+    ["operation"],
+)
+admission_rejected = Counter(
+    "admission_rejected_total",
+    "Requests turned away by admission control",
+    ["reason"],
+)
+http_seconds = Histogram(
+    "http_request_seconds",
+    "Time until the response headers are sent, per route",
+    ["method", "route", "status"],
+)
@@ -0,0 +1,70 @@
+from common import cache
+
+
+def normalize(message):
+    """Case, spacing and trailing punctuation do not change what is being asked."""
+    return " ".join(message.lower().split()).rstrip("?!. ")
+
+
+class ResponseCache(cache.TTLCache):
+    """Answers of earlier runs, reused when the same message comes in on the same thread.
+
+    An answer is only kept when its run did not call a tool that writes, it
+    expires with the shortest max_age of the tools it used, and it is dropped
+    as soon as the state of a tool it read (e.g. the tasks table) has changed.
+    Take a snapshot() before the run, so changes made during the run count too.
+    """
+
+    def __init__(self, registry, maxsize=256, ttl=3600):
+        super().__init__(maxsize=maxsize, ttl=ttl, name="responses")
+        self.registry = registry
+        # answers not kept because of the tools they used, or dropped because their state changed
+        self.skipped = 0
+        self.invalidated = 0
+        cache.caches[self.name] = self
+
+    def snapshot(self):
+        """The current state of every tool that has one."""
+        return {tool.name: tool.state() for tool in self.registry if tool.state is not None}
+
+    def lookup(self, thread_id, message):
+        key = (thread_id, normalize(message))
+        entry = self.get(key)
+        if entry is not None:
+            response, states = entry
+            if all(self.registry.get(name).state() == state for name, state in states.items()):
+                with self._lock:
+                    self.hits += 1
+                    # a hit makes the entry the most recently used, so eviction is LRU
+                    if key in self._data:
+                        self._data.move_to_end(key)
+                return response
+            self.invalidate(key)
+            with self._lock:
+                self.invalidated += 1
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, thread_id, message, result, snapshot):
+        """Keeps result["response"] if the tools in result["tools"] allow it."""
+        ttl = self.ttl
+        states = {}
+        for name in result.get("tools", ()):
+            tool = self.registry.get(name) if name in self.registry else None
+            if tool is None or tool.writes:
+                with self._lock:
+                    self.skipped += 1
+                return
+            if tool.max_age is not None:
+                ttl = min(ttl, tool.max_age)
+            if tool.state is not None:
+                states[name] = snapshot[name]
+        self.set((thread_id, normalize(message)), (result["response"], states), ttl)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["skipped"] = self.skipped
+            stats["invalidated"] = self.invalidated
+        return stats
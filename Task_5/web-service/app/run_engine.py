@@ -0,0 +1,244 @@
+import asyncio
+import time
+
+import openai
+
+import assistant
+import metrics
+
+client = assistant.async_client
+
+# Runs usually finish in well under a second once the model starts answering,
+# so polling starts fast and backs off towards the old fixed interval
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 2.0
+POLL_BACKOFF = 1.5
+
+FINAL_STATUSES = ["completed", "failed", "cancelled", "expired", "incomplete"]
+
+
+async def wait_for_run(thread_id, run):
+    """Polls the run with adaptive backoff until it is finished or needs a tool call."""
+    delay = POLL_INITIAL_DELAY
+    polls = 0
+    with metrics.stage_seconds.time(stage="poll"):
+        while run.status not in FINAL_STATUSES and run.status != "requires_action":
+            await asyncio.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+            run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+            polls += 1
+    metrics.poll_iterations.observe(polls)
+    return run
+
+
+async def run_tool_call(tool_call):
+    """Runs one tool off the event loop, returning its output for submit_tool_outputs."""
+    name = tool_call.function.name
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        # tool functions are blocking (requests, sqlite), they run in a thread
+        output = await asyncio.wait_for(
+            assistant.tool_runner.execute_async(tool_call),
+            assistant.tool_runner.timeout(name)
+        )
+    except Exception as e:
+        outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+        output = assistant.tool_runner.error_output(name, e)
+    # only registered names, so the label can not grow without bound
+    metrics.tool_seconds.observe(time.perf_counter() - started,
+                                 tool=name if name in assistant.registry else "unknown", outcome=outcome)
+    return {
+        "tool_call_id": tool_call.id,
+        "output": str(output)
+    }
+
+
+async def handle_required_action(thread_id, run):
+    """Runs the requested tools concurrently and hands all outputs back in one submission."""
+    print("Run requires action, assistant wants to use a tool")
+    tool_calls = run.required_action.submit_tool_outputs.tool_calls
+    with metrics.stage_seconds.time(stage="tools"):
+        tool_outputs = await asyncio.gather(*(run_tool_call(tool_call) for tool_call in tool_calls))
+
+    with metrics.stage_seconds.time(stage="submit_tool_outputs"):
+        return await client.beta.threads.runs.submit_tool_outputs(
+            thread_id=thread_id,
+            run_id=run.id,
+            tool_outputs=tool_outputs
+        )
+
+
+async def cancel_run(thread_id, run_id):
+    """Stops a run nobody is waiting for anymore."""
+    try:
+        await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        print(f"Run {run_id} cancelled, client went away")
+    except openai.OpenAIError as e:
+        # the run may have finished in the meantime
+        print(f"Could not cancel run {run_id}: {e}")
+
+
+async def add_user_messages(thread_id, user_input):
+    """Adds one message, or a list of queued messages in order, to the thread."""
+    messages = [user_input] if isinstance(user_input, str) else user_input
+    with metrics.stage_seconds.time(stage="messages_create"):
+        for content in messages:
+            await client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=content
+            )
+
+
+async def interact_with_assistant(thread_id, user_input):
+    """Async version of assistant.interact_with_assistant for the web service.
+
+    user_input can also be a list of messages, which are answered by a single run.
+    """
+    started = time.perf_counter()
+    await add_user_messages(thread_id, user_input)
+
+    with metrics.stage_seconds.time(stage="runs_create"):
+        run = await client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant.get_assistant().id
+        )
+
+    # tools the answer was built from, the response cache decides on them
+    tools_used = set()
+    try:
+        run = await wait_for_run(thread_id, run)
+        while run.status == "requires_action":
+            tools_used.update(call.function.name for call in run.required_action.submit_tool_outputs.tool_calls)
+            run = await handle_required_action(thread_id, run)
+            run = await wait_for_run(thread_id, run)
+    except asyncio.CancelledError:
+        metrics.run_seconds.observe(time.perf_counter() - started, mode="poll", status="disconnected")
+        await cancel_run(thread_id, run.id)
+        raise
+
+    final_answer = None
+    if run.status == "completed":
+        with metrics.stage_seconds.time(stage="messages_list"):
+            messages = await client.beta.threads.messages.list(thread_id=thread_id, limit=1)
+        final_answer = messages.data[0].content[0].text.value
+    else:
+        if getattr(run, 'last_error', None) is not None:
+            error_message = run.last_error.message
+        else:
+            error_message = "No error message found..."
+
+        print(f"Run {run.id} ended with status {run.status}\n  thread_id: {run.thread_id}\n  assistant_id: {run.assistant_id}\n  error_message: {error_message}")
+
+    metrics.run_seconds.observe(time.perf_counter() - started, mode="poll", status=run.status)
+    return {"response": final_answer, "thread_id": thread_id, "tools": sorted(tools_used)}
+
+
+async def stream_assistant(thread_id, user_input):
+    """Streams a run, yielding (event, data) pairs as tokens and tool calls come in.
+
+    The last pair is ("done", {"response": ...}) with the full answer, or
+    ("error", {...}) if the run did not complete.
+    """
+    started = time.perf_counter()
+    await add_user_messages(thread_id, user_input)
+
+    with metrics.stage_seconds.time(stage="runs_create"):
+        stream = await client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant.get_assistant().id,
+            stream=True
+        )
+
+    run_id = None
+    finished = False
+    answer_parts = []
+    try:
+        while stream is not None:
+            next_stream = None
+            try:
+                async for event in stream:
+                    if event.event == "thread.run.created":
+                        run_id = event.data.id
+                        yield "run", {"run_id": run_id, "status": event.data.status}
+
+                    elif event.event == "thread.message.delta":
+                        for part in event.data.delta.content or []:
+                            if part.type == "text" and part.text and part.text.value:
+                                if not answer_parts:
+                                    metrics.stage_seconds.observe(time.perf_counter() - started, stage="first_token")
+                                answer_parts.append(part.text.value)
+                                yield "delta", {"text": part.text.value}
+
+                    elif event.event == "thread.run.step.delta":
+                        details = event.data.delta.step_details
+                        if details is not None and details.type == "tool_calls":
+                            for call in details.tool_calls or []:
+                                # the name only arrives with the first delta of each call
+                                if call.type == "function" and call.function and call.function.name:
+                                    yield "tool_call", {"name": call.function.name, "status": "requested"}
+
+                    elif event.event == "thread.run.requires_action":
+                        run = event.data
+                        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+                        tools_started = time.perf_counter()
+                        pending = {}
+                        for tool_call in tool_calls:
+                            yield "tool_call", {"name": tool_call.function.name, "status": "running"}
+                            pending[asyncio.ensure_future(run_tool_call(tool_call))] = tool_call
+                        tasks = list(pending)
+                        try:
+                            # report each tool as it finishes, they all run at the same time
+                            while pending:
+                                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                                for task in done:
+                                    yield "tool_call", {"name": pending.pop(task).function.name, "status": "completed"}
+                        finally:
+                            for task in pending:
+                                task.cancel()
+                        tool_outputs = [task.result() for task in tasks]
+                        metrics.stage_seconds.observe(time.perf_counter() - tools_started, stage="tools")
+
+                        # the run continues on a new stream once the outputs are in
+                        with metrics.stage_seconds.time(stage="submit_tool_outputs"):
+                            next_stream = await client.beta.threads.runs.submit_tool_outputs(
+                                thread_id=thread_id,
+                                run_id=run.id,
+                                tool_outputs=tool_outputs,
+                                stream=True
+                            )
+
+                    elif event.event == "thread.run.completed":
+                        finished = True
+
+                    elif event.event in ("thread.run.failed", "thread.run.cancelled",
+                                         "thread.run.expired", "thread.run.incomplete"):
+                        finished = True
+                        run = event.data
+                        if getattr(run, 'last_error', None) is not None:
+                            error_message = run.last_error.message
+                        else:
+                            error_message = "No error message found..."
+                        print(f"Run {run.id} ended with status {run.status}\n  thread_id: {run.thread_id}\n  error_message: {error_message}")
+                        metrics.run_seconds.observe(time.perf_counter() - started, mode="stream", status=run.status)
+                        yield "error", {"status": run.status, "message": error_message}
+                        return
+
+                    elif event.event == "error":
+                        finished = True
+                        metrics.run_seconds.observe(time.perf_counter() - started, mode="stream", status="error")
+                        yield "error", {"status": "error", "message": str(event.data)}
+                        return
+            finally:
+                await stream.close()
+            stream = next_stream
+    except (asyncio.CancelledError, GeneratorExit):
+        # the client went away mid-stream
+        if run_id is not None and not finished:
+            metrics.run_seconds.observe(time.perf_counter() - started, mode="stream", status="disconnected")
+            await cancel_run(thread_id, run_id)
+        raise
+
+    metrics.run_seconds.observe(time.perf_counter() - started, mode="stream", status="completed")
+    yield "done", {"response": "".join(answer_parts), "thread_id": thread_id}
@@ -0,0 +1,209 @@
+import asyncio
+from collections import deque
+
+# Most queued user messages answered together by one run
+MAX_COALESCED_MESSAGES = 10
+
+# Marks the end of a stream job's events
+STREAM_END = object()
+
+
+class Job:
+    """One queued request: a plain message, or a streamed one that gets its own run."""
+
+    def __init__(self, message, stream=False):
+        self.message = message
+        self.stream = stream
+        self.future = asyncio.get_running_loop().create_future()
+        # stream jobs receive their (event, data) pairs here
+        self.events = asyncio.Queue() if stream else None
+        # jobs ahead of this one when it was queued, including the active run
+        self.position = 0
+
+    async def result(self):
+        return await self.future
+
+    async def iter_events(self):
+        try:
+            while True:
+                item = await self.events.get()
+                if item is STREAM_END:
+                    return
+                yield item
+        finally:
+            # tells the worker to stop streaming if the client went away
+            if not self.future.done():
+                self.future.cancel()
+
+
+class RunQueue:
+    """FIFO of messages per thread, with at most one active run on each thread.
+
+    The Assistants API refuses new messages on a thread while a run is active,
+    so every request for a thread goes through its queue. Plain messages that
+    are waiting when a run finishes are coalesced into the next run.
+
+    The backend (see backends.py) produces the answers. With a ThreadManager,
+    the queue is per conversation and every run goes to the conversation's
+    current OpenAI thread, which may be replaced between runs.
+
+    Messages and answers are saved to the message history here: the user
+    messages when their run starts, the answer as soon as the run completes,
+    whether or not the client is still waiting. So the history of a
+    conversation is in the same order as its OpenAI thread, and holds nothing
+    of runs that have not started yet.
+    """
+
+    def __init__(self, backend, writer, threads=None):
+        self.backend = backend
+        self.writer = writer
+        self.threads = threads
+        self._queues = {}
+        self._workers = {}
+        self._active = {}
+
+    def submit(self, thread_id, message, stream=False):
+        job = Job(message, stream)
+        queue = self._queues.setdefault(thread_id, deque())
+        job.position = len(queue) + (1 if self._active.get(thread_id) else 0)
+        queue.append(job)
+        if thread_id not in self._workers:
+            self._workers[thread_id] = asyncio.create_task(self._work(thread_id))
+        return job
+
+    def status(self, thread_id):
+        return {
+            "thread_id": thread_id,
+            "active": bool(self._active.get(thread_id)),
+            "queued": len(self._queues.get(thread_id, ())),
+        }
+
+    async def close(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+    def _next_batch(self, queue):
+        """Takes the next job, plus the plain messages queued right behind it."""
+        batch = []
+        while queue:
+            job = queue[0]
+            if job.future.done():
+                # the caller gave up while waiting
+                queue.popleft()
+                continue
+            if batch and (job.stream or batch[0].stream or len(batch) >= MAX_COALESCED_MESSAGES):
+                break
+            batch.append(queue.popleft())
+        return batch
+
+    async def _work(self, thread_id):
+        queue = self._queues[thread_id]
+        try:
+            while queue:
+                batch = self._next_batch(queue)
+                if not batch:
+                    continue
+                self._active[thread_id] = True
+                try:
+                    if batch[0].stream:
+                        await self._run_stream(thread_id, batch[0])
+                    else:
+                        await self._run_batch(thread_id, batch)
+                finally:
+                    self._active[thread_id] = False
+        finally:
+            del self._workers[thread_id]
+            self._queues.pop(thread_id, None)
+            self._active.pop(thread_id, None)
+
+    async def _openai_thread(self, thread_id):
+        return await self.threads.active_thread(thread_id) if self.threads else thread_id
+
+    async def _after_run(self, thread_id, openai_thread, messages, response):
+        if not self.threads:
+            return
+        try:
+            await self.threads.record_run(thread_id, openai_thread, messages, response)
+        except Exception as e:
+            print(f"Could not record run on thread {openai_thread}: {e}")
+
+    async def _run_batch(self, thread_id, batch):
+        futures = [job.future for job in batch]
+        messages = [job.message for job in batch]
+        try:
+            openai_thread = await self._openai_thread(thread_id)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for message in messages:
+            self.writer.add(thread_id, "user", message)
+        run = asyncio.ensure_future(self.backend.respond(openai_thread, messages))
+
+        # keep the run going while anyone is still waiting for it
+        try:
+            while not run.done():
+                waiting = [future for future in futures if not future.done()]
+                if not waiting:
+                    run.cancel()
+                    break
+                await asyncio.wait([run, *waiting], return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # shutting down
+            run.cancel()
+            raise
+
+        try:
+            result = await run
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if result["response"] is not None:
+            self.writer.add(thread_id, "assistant", result["response"])
+        for future in futures:
+            if not future.done():
+                future.set_result(dict(result, batch_size=len(batch)))
+
+        if result["response"] is not None:
+            await self._after_run(thread_id, openai_thread, messages, result["response"])
+
+    async def _run_stream(self, thread_id, job):
+        response = None
+        try:
+            openai_thread = await self._openai_thread(thread_id)
+            self.writer.add(thread_id, "user", job.message)
+            events = self.backend.stream(openai_thread, job.message)
+        except Exception as e:
+            print(f"Streaming run on thread {thread_id} failed: {e}")
+            await job.events.put(("error", {"status": "error", "message": str(e)}))
+            if not job.future.done():
+                job.future.set_result(None)
+            await job.events.put(STREAM_END)
+            return
+        try:
+            async for event in events:
+                if job.future.done():
+                    # client disconnected, closing the generator cancels the run
+                    break
+                if event[0] == "done":
+                    response = event[1]["response"]
+                await job.events.put(event)
+        except Exception as e:
+            print(f"Streaming run on thread {thread_id} failed: {e}")
+            await job.events.put(("error", {"status": "error", "message": str(e)}))
+        finally:
+            await events.aclose()
+            if not job.future.done():
+                job.future.set_result(None)
+            await job.events.put(STREAM_END)
+
+        if response is not None:
+            self.writer.add(thread_id, "assistant", response)
+            await self._after_run(thread_id, openai_thread, [job.message], response)
@@ -0,0 +1,364 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from common.sqlite_util import match_expression, migrate
+
+# Resolved next to this file, so it does not depend on where uvicorn was started from
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "message-history.db")
+
+INSERT_MESSAGE = '''
+    INSERT INTO messages (thread_id, role, content)
+    VALUES (?, ?, ?)
+'''
+
+# Same, with the time the message was accepted rather than the time it was written
+INSERT_MESSAGE_AT = '''
+    INSERT INTO messages (thread_id, role, content, created_at)
+    VALUES (?, ?, ?, ?)
+'''
+
+# Schema changes, applied in order. PRAGMA user_version records how many have run,
+# so add new steps to the end and never edit one that has shipped.
+MIGRATIONS = [
+    # 1: base schema, same as test.py
+    '''
+    CREATE TABLE IF NOT EXISTS threads (
+        id TEXT PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        thread_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (thread_id) REFERENCES threads (id)
+    );
+    ''',
+    # 2: conversation history is always read per thread in time order
+    '''
+    CREATE INDEX IF NOT EXISTS idx_messages_thread_created
+        ON messages (thread_id, created_at);
+    ''',
+    # 3: full-text index over message content for /search-messages/, kept in sync by triggers
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='id', tokenize='porter unicode61'
+    );
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+    INSERT INTO messages_fts (messages_fts) VALUES ('rebuild');
+    ''',
+    # 4: threads records the OpenAI threads of each conversation, see thread_manager.py
+    '''
+    ALTER TABLE threads ADD COLUMN conversation_id TEXT;
+    ALTER TABLE threads ADD COLUMN parent_id TEXT;
+    ALTER TABLE threads ADD COLUMN summary TEXT;
+    ALTER TABLE threads ADD COLUMN summarized_through INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE threads ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE threads ADD COLUMN token_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE threads ADD COLUMN retired_at TIMESTAMP;
+    CREATE INDEX IF NOT EXISTS idx_threads_conversation ON threads (conversation_id, retired_at);
+    ''',
+]
+
+# Keyset pagination: the cursor is a message id, compared on (created_at, id) so the
+# index above serves both the filter and the order without a sort
+SELECT_NEWEST_MESSAGES = '''
+    SELECT id, role, content, created_at FROM messages
+    WHERE thread_id = ?
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+'''
+
+SELECT_MESSAGES_BEFORE = '''
+    SELECT id, role, content, created_at FROM messages
+    WHERE thread_id = ?
+      AND (created_at, id) < (SELECT created_at, id FROM messages WHERE id = ?)
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+'''
+
+SELECT_MESSAGES_AFTER = '''
+    SELECT id, role, content, created_at FROM messages
+    WHERE thread_id = ?
+      AND (created_at, id) > (SELECT created_at, id FROM messages WHERE id = ?)
+    ORDER BY created_at ASC, id ASC
+    LIMIT ?
+'''
+
+SELECT_ACTIVE_THREAD = '''
+    SELECT id, summary, summarized_through, message_count, token_count FROM threads
+    WHERE conversation_id = ? AND retired_at IS NULL
+    ORDER BY created_at DESC, rowid DESC
+    LIMIT 1
+'''
+
+# Adopting the configured thread as the first thread of its conversation, counting
+# the history it already has. The row may exist from before threads had lineage.
+ADOPT_THREAD = '''
+    INSERT INTO threads (id, conversation_id, message_count, token_count)
+    SELECT ?, ?, COUNT(*), COALESCE(SUM(LENGTH(content)), 0) / ? FROM messages WHERE thread_id = ?
+    ON CONFLICT (id) DO UPDATE SET
+        conversation_id = excluded.conversation_id,
+        message_count = excluded.message_count,
+        token_count = excluded.token_count
+'''
+
+# Best matches first (bm25, lower is better), with the matching words wrapped in <mark>
+SEARCH_MESSAGES = '''
+    SELECT m.id, m.thread_id, m.role, m.created_at,
+           snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16),
+           bm25(messages_fts)
+    FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+    WHERE messages_fts MATCH ?{filters}
+    ORDER BY bm25(messages_fts), m.id
+    LIMIT ? OFFSET ?
+'''
+
+
+class Storage:
+    """Bounded pool of SQLite connections with a dedicated executor for running queries.
+
+    Open it once when the app starts and close it on shutdown. All queries go through
+    the executor, so the event loop never waits on disk.
+    """
+
+    def __init__(self, path=DB_PATH, pool_size=4, statement_cache_size=128, busy_timeout=5.0):
+        self.path = path
+        self.pool_size = pool_size
+        self.statement_cache_size = statement_cache_size
+        self.busy_timeout = busy_timeout
+        self._pool = None
+        self._executor = None
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            # connections are handed between executor threads, never used by two at once
+            check_same_thread=False,
+            # sqlite3 keeps this many prepared statements per connection, keyed by SQL text
+            cached_statements=self.statement_cache_size,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def open(self):
+        if self._pool is not None:
+            return
+        self._pool = queue.Queue(maxsize=self.pool_size)
+        for _ in range(self.pool_size):
+            self._pool.put(self._connect())
+        connection = self._pool.get()
+        try:
+            migrate(connection, MIGRATIONS, "message-history")
+        finally:
+            self._pool.put(connection)
+        # one worker per connection, so a worker never waits for a free connection
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="storage")
+
+    def close(self):
+        if self._pool is None:
+            return
+        self._executor.shutdown(wait=True)
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+        self._pool = None
+        self._executor = None
+
+    def _call(self, fn, args, operation):
+        connection = self._pool.get()
+        try:
+            with metrics.db_seconds.time(operation=operation):
+                # commits on success, rolls back if fn raises
+                with connection:
+                    return fn(connection, *args)
+        finally:
+            self._pool.put(connection)
+
+    async def run(self, fn, *args, operation="query"):
+        """Runs fn(connection, *args) in one transaction on the storage executor.
+
+        operation names the query in the db_query_seconds metric.
+        """
+        if self._pool is None:
+            raise RuntimeError("Storage is not open")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args, operation)
+
+    async def execute(self, sql, params=(), operation="execute"):
+        return await self.run(lambda connection: connection.execute(sql, params).lastrowid, operation=operation)
+
+    async def executemany(self, sql, rows, operation="executemany"):
+        return await self.run(lambda connection: connection.executemany(sql, rows).rowcount, operation=operation)
+
+    async def fetchall(self, sql, params=(), operation="fetchall"):
+        return await self.run(lambda connection: connection.execute(sql, params).fetchall(), operation=operation)
+
+    async def add_message(self, thread_id, role, content):
+        return await self.execute(INSERT_MESSAGE, (thread_id, role, content), operation="add_message")
+
+    async def get_messages(self, thread_id, limit=50, before_id=None, after_id=None):
+        """Returns (rows, has_more) for one page of a thread, oldest message first.
+
+        Without a cursor this is the newest `limit` messages. before_id pages towards
+        older messages and after_id towards newer ones.
+        """
+        # one extra row tells us whether there is another page
+        if after_id is not None:
+            rows = await self.fetchall(SELECT_MESSAGES_AFTER, (thread_id, after_id, limit + 1), operation="get_messages")
+            has_more = len(rows) > limit
+            return rows[:limit], has_more
+
+        if before_id is not None:
+            rows = await self.fetchall(SELECT_MESSAGES_BEFORE, (thread_id, before_id, limit + 1), operation="get_messages")
+        else:
+            rows = await self.fetchall(SELECT_NEWEST_MESSAGES, (thread_id, limit + 1), operation="get_messages")
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        return rows, has_more
+
+    async def search_messages(self, query, thread_id=None, role=None, limit=20, offset=0):
+        """Returns (rows, has_more) for one page of full-text search results, best match first.
+
+        Each row is (id, thread_id, role, created_at, snippet, score).
+        """
+        expression = match_expression(query)
+        if not expression:
+            return [], False
+        filters = ""
+        params = [expression]
+        if thread_id is not None:
+            filters += " AND m.thread_id = ?"
+            params.append(thread_id)
+        if role is not None:
+            filters += " AND m.role = ?"
+            params.append(role)
+        # one extra row tells us whether there is another page
+        params += [limit + 1, offset]
+        rows = await self.fetchall(SEARCH_MESSAGES.format(filters=filters), params, operation="search_messages")
+        return rows[:limit], len(rows) > limit
+
+    async def get_active_thread(self, conversation_id):
+        """(id, summary, summarized_through, message_count, token_count) of the conversation's current thread, or None."""
+        rows = await self.fetchall(SELECT_ACTIVE_THREAD, (conversation_id,), operation="threads")
+        return rows[0] if rows else None
+
+    async def adopt_thread(self, thread_id, conversation_id, chars_per_token):
+        await self.execute(ADOPT_THREAD, (thread_id, conversation_id, chars_per_token, conversation_id), operation="threads")
+
+    async def count_thread_usage(self, thread_id, messages, tokens):
+        """Adds to a thread's counters and returns the new (message_count, token_count)."""
+        def update(connection):
+            connection.execute(
+                'UPDATE threads SET message_count = message_count + ?, token_count = token_count + ? WHERE id = ?',
+                (messages, tokens, thread_id))
+            return connection.execute(
+                'SELECT message_count, token_count FROM threads WHERE id = ?', (thread_id,)).fetchone()
+        return await self.run(update, operation="threads")
+
+    async def get_messages_after(self, thread_id, after_id, limit):
+        """(id, role, content) of the newest `limit` messages with an id above after_id, oldest first."""
+        rows = await self.fetchall(
+            'SELECT id, role, content FROM messages WHERE thread_id = ? AND id > ? ORDER BY id DESC LIMIT ?',
+            (thread_id, after_id, limit), operation="get_messages")
+        rows.reverse()
+        return rows
+
+    async def rotate_thread(self, old_id, new_id, conversation_id, summary, summarized_through, messages, tokens):
+        """Retires old_id and records new_id as its successor, in one transaction."""
+        def rotate(connection):
+            connection.execute('UPDATE threads SET retired_at = CURRENT_TIMESTAMP WHERE id = ?', (old_id,))
+            connection.execute(
+                '''INSERT INTO threads (id, conversation_id, parent_id, summary, summarized_through, message_count, token_count)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                (new_id, conversation_id, old_id, summary, summarized_through, messages, tokens))
+        await self.run(rotate, operation="threads")
+
+
+class MessageWriter:
+    """Write-behind queue for chat messages.
+
+    add() only queues the message. A background task writes everything queued
+    in one transaction, as soon as max_batch rows are waiting or flush_interval
+    seconds after the first one, so each request stops paying for its own commit.
+    Call flush() before reading messages back, and close() on shutdown.
+    """
+
+    def __init__(self, storage, flush_interval=0.005, max_batch=256, retry_delay=0.5):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.retry_delay = retry_delay
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    def add(self, thread_id, role, content):
+        # same format as CURRENT_TIMESTAMP, so ordering by created_at keeps working
+        created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        self._queue.put_nowait((thread_id, role, content, created_at))
+
+    async def flush(self):
+        """Waits until every message added so far is committed."""
+        await self._queue.join()
+
+    async def close(self, timeout=10):
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Message writer closed with {self._queue.qsize()} unsaved message(s)")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _next_batch(self):
+        rows = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(rows) < self.max_batch:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return rows
+
+    async def _run(self):
+        while True:
+            rows = await self._next_batch()
+            while True:
+                try:
+                    await self.storage.executemany(INSERT_MESSAGE_AT, rows, operation="write_messages")
+                    break
+                except Exception as e:
+                    # keep the batch and try again, flush() waits for it
+                    print(f"Saving {len(rows)} message(s) failed, retrying: {e}")
+                    await asyncio.sleep(self.retry_delay)
+            for _ in rows:
+                self._queue.task_done()
@@ -24,6 +24,12 @@ def initialize_db():
         )
     ''')
 
+    # Index for reading a thread's history in time order
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_thread_created
+            ON messages (thread_id, created_at)
+    ''')
+
     connection.commit()
     connection.close()
 
@@ -0,0 +1,99 @@
+import re
+
+import run_engine
+
+# Rough token estimate, good enough to decide when a thread has grown too long
+CHARS_PER_TOKEN = 4
+
+# How much of one message makes it into the summary
+SUMMARY_LINE_CHARS = 200
+
+# Messages read from the history when a summary is built
+SUMMARY_SOURCE_MESSAGES = 200
+
+
+def first_sentence(text, max_chars=SUMMARY_LINE_CHARS):
+    text = " ".join(text.split())
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    if match:
+        text = match.group(1)
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+def build_summary(previous_summary, rows, max_chars):
+    """Extractive rolling summary: the previous summary, then the first sentence of every
+    message since, keeping only the most recent max_chars characters worth of lines."""
+    lines = previous_summary.splitlines() if previous_summary else []
+    lines += [f"{role}: {first_sentence(content)}" for _, role, content in rows]
+    kept = []
+    size = 0
+    for line in reversed(lines):
+        if size + len(line) + 1 > max_chars:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    kept.reverse()
+    return "\n".join(kept)
+
+
+class ThreadManager:
+    """Keeps each conversation on an OpenAI thread of bounded size.
+
+    The conversation id is the thread id from config.json. It stays the same
+    for the message history and the API, while the OpenAI thread behind it is
+    replaced by a fresh one, seeded with a summary of the conversation, once it
+    holds max_messages messages or about max_tokens tokens. Every thread is
+    recorded in the threads table with its parent and summary.
+
+    Only call this from the conversation's run queue worker, so a thread is
+    never replaced while a run is active on it. The worker saves each run's
+    messages when the run starts, and its answer before record_run(), so the
+    history read here ends with the run that was just recorded.
+    """
+
+    def __init__(self, db, writer, max_messages=40, max_tokens=8000, summary_chars=2000):
+        self.db = db
+        self.writer = writer
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.summary_chars = summary_chars
+
+    async def active_thread(self, conversation_id):
+        """The OpenAI thread currently used by the conversation."""
+        row = await self.db.get_active_thread(conversation_id)
+        if row is not None:
+            return row[0]
+        # the configured thread is the first thread of its conversation, with the history saved so far;
+        # called before the run saves its messages, so record_run() does not count them twice
+        await self.writer.flush()
+        await self.db.adopt_thread(conversation_id, conversation_id, CHARS_PER_TOKEN)
+        return conversation_id
+
+    async def record_run(self, conversation_id, thread_id, messages, response):
+        """Counts the user messages and the answer a run added to thread_id and rotates the thread if it is full."""
+        tokens = (sum(len(message) for message in messages) + len(response)) // CHARS_PER_TOKEN
+        message_count, token_count = await self.db.count_thread_usage(thread_id, len(messages) + 1, tokens)
+        if message_count >= self.max_messages or token_count >= self.max_tokens:
+            try:
+                await self.rotate(conversation_id)
+            except Exception as e:
+                # keep using the old thread, the next run tries again
+                print(f"Could not rotate thread {thread_id}: {e}")
+
+    async def rotate(self, conversation_id):
+        # everything up to the answer of the run that filled the thread, and nothing of later runs
+        await self.writer.flush()
+        old_id, previous_summary, summarized_through, _, _ = await self.db.get_active_thread(conversation_id)
+        rows = await self.db.get_messages_after(conversation_id, summarized_through, SUMMARY_SOURCE_MESSAGES)
+        summary = build_summary(previous_summary, rows, self.summary_chars)
+
+        messages = []
+        if summary:
+            messages.append({"role": "assistant", "content": "Summary of our conversation so far:\n" + summary})
+        thread = await run_engine.client.beta.threads.create(messages=messages)
+
+        last_id = rows[-1][0] if rows else summarized_through
+        await self.db.rotate_thread(old_id, thread.id, conversation_id, summary, last_id,
+                                    len(messages), len(summary) // CHARS_PER_TOKEN)
+        print(f"Conversation {conversation_id} moved from thread {old_id} to {thread.id}")
+        return thread.id
@@ -0,0 +1,211 @@
+"""Micro-benchmarks for the local hot paths: tool dispatch, to-do list output,
+message history INSERT/SELECT and /conversation-history/ JSON.
+
+Runs offline against SQLite fixtures seeded into a temporary directory.
+
+    python benchmarks/run.py                      # run and print
+    python benchmarks/run.py --save-baseline      # run and save benchmarks/baseline.json
+    python benchmarks/run.py --compare            # run and compare against the baseline
+    python benchmarks/run.py --sizes 10000        # only the 10k row message fixture
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'Task_5', 'web-service', 'app'))
+from common.tasks_db import TaskStore, register_task_tools
+from common.tool_registry import ToolRegistry
+import storage
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Message history fixture sizes, in rows
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# Seeded, so every run works on the same data
+SEED = 1234
+THREADS = 100
+# Thread with enough messages for the largest /conversation-history/ page
+HISTORY_THREAD = "thread_history"
+HISTORY_LIMITS = (50, 500)
+WORDS = ("weather quote news task milk homework meeting rain sun riga liepaja today tomorrow "
+         "please remind show list add delete complete done pending what is the how").split()
+
+results = {}
+
+
+def measure(name, fn, min_time=0.5):
+    """Calls fn() repeatedly for min_time seconds (at least 5 times) and records the timings.
+
+    Regressions are judged on the fastest round, which is the least affected by
+    whatever else the machine is doing; the median is kept for reference.
+    """
+    fn()  # warm up caches and prepared statements
+    times = []
+    started = time.perf_counter()
+    while len(times) < 5 or time.perf_counter() - started < min_time:
+        before = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - before)
+    record(name, min(times), statistics.median(times), len(times))
+
+
+def record(name, best, median, rounds, unit="ops", compared=True):
+    results[name] = {"min_s": best, "median_s": median, "rounds": rounds, "compared": compared}
+    print(f"{name:<40} {best * 1000:>10.3f} ms {1 / best:>14,.0f} {unit}/s  ({rounds} rounds)")
+
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def bench_tools(directory):
+    rng = random.Random(SEED)
+    store = TaskStore(os.path.join(directory, 'tasks.db'))
+    store.add_tasks([sentence(rng, 6) for _ in range(10_000)])
+    store.update_tasks_status([(task_id, 'completed') for task_id in range(1, 10_001, 3)])
+
+    registry = ToolRegistry()
+    register_task_tools(registry, store)
+
+    @registry.tool
+    def echo(text: str, times: int = 1):
+        """Returns the text"""
+        return text * times
+
+    measure("dispatch.echo", lambda: registry.call("echo", '{"text": "hello", "times": 2}'))
+    updates = json.dumps({"updates": [{"task_id": i, "new_status": "pending"} for i in range(50)]})
+    tool = registry.get("update_tasks_status")
+    measure("dispatch.parse_50_updates", lambda: tool.parse_arguments(updates))
+    measure("tasks.format_page_50", lambda: registry.call("get_tasks_from_db", '{"limit": 50}'))
+    measure("tasks.format_page_200", lambda: registry.call("get_tasks_from_db", '{"limit": 200}'))
+    measure("tasks.filter_status", lambda: registry.call("get_tasks_from_db", '{"status": "completed", "after_id": 5000}'))
+    measure("tasks.search", lambda: registry.call("get_tasks_from_db", '{"query": "milk rain"}'))
+    store.close()
+
+
+def bench_messages(directory, size, with_json=False):
+    rng = random.Random(SEED)
+    db = storage.Storage(os.path.join(directory, f'messages-{size}.db'))
+    db.open()
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(db.executemany(
+        'INSERT INTO threads (id) VALUES (?)', [(f"thread_{i}",) for i in range(THREADS)]))
+
+    rows = [
+        (f"thread_{i % THREADS}", "user" if i % 2 == 0 else "assistant", sentence(rng, 12))
+        for i in range(size)
+    ]
+    batch = 10_000
+
+    def insert_all():
+        for start in range(0, size, batch):
+            loop.run_until_complete(db.executemany(storage.INSERT_MESSAGE, rows[start:start + batch]))
+
+    # the INSERT benchmark is the seeding itself, so it only runs once, timed per row;
+    # one round is too noisy to fail --compare on, it is printed for reference only
+    before = time.perf_counter()
+    insert_all()
+    elapsed = time.perf_counter() - before
+    record(f"messages.insert_{size}", elapsed / size, elapsed / size, 1, unit="rows", compared=False)
+
+    thread_id = "thread_7"
+    middle_id = size // 2 + 7
+    measure(f"messages.select_newest_{size}",
+            lambda: loop.run_until_complete(db.get_messages(thread_id, 50)))
+    measure(f"messages.select_before_{size}",
+            lambda: loop.run_until_complete(db.get_messages(thread_id, 50, before_id=middle_id)))
+    measure(f"messages.search_{size}",
+            lambda: loop.run_until_complete(db.search_messages("weather today", thread_id, limit=20)))
+
+    if with_json:
+        bench_history_json(db, loop, rng)
+
+    db.close()
+    loop.close()
+
+
+def bench_history_json(db, loop, rng):
+    # a thread of its own, the fixture threads can hold fewer messages than the largest page
+    loop.run_until_complete(db.executemany('INSERT INTO threads (id) VALUES (?)', [(HISTORY_THREAD,)]))
+    loop.run_until_complete(db.executemany(storage.INSERT_MESSAGE, [
+        (HISTORY_THREAD, "user" if i % 2 == 0 else "assistant", sentence(rng, 12))
+        for i in range(max(HISTORY_LIMITS))
+    ]))
+    for limit in HISTORY_LIMITS:
+        page, has_more = loop.run_until_complete(db.get_messages(HISTORY_THREAD, limit))
+        assert len(page) == limit, f"history fixture has {len(page)} messages, expected {limit}"
+        response = {
+            "thread_id": HISTORY_THREAD,
+            "conversation_history": [
+                {"id": row[0], "sender": row[1], "content": row[2], "created_at": row[3]} for row in page
+            ],
+            "next_cursor": page[0][0] if has_more else None,
+        }
+        measure(f"history.json_{limit}", lambda: json.dumps(response))
+
+
+def compare(baseline, threshold):
+    """Prints the change against the baseline. Returns the names that got slower than threshold."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None or not result["compared"]:
+            continue
+        change = result["min_s"] / old["min_s"] - 1
+        marker = ""
+        if change > threshold:
+            marker = "  <-- slower"
+            regressions.append(name)
+        print(f"{name:<40} {change:>+8.1%}{marker}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the local hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="message history fixture sizes")
+    parser.add_argument("--save-baseline", action="store_true", help=f"save the results to {BASELINE_PATH}")
+    parser.add_argument("--compare", action="store_true", help="compare against the saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        # checked before running anything, a full run takes a while
+        try:
+            with open(BASELINE_PATH) as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            print(f"No baseline at {BASELINE_PATH}, create one with: python benchmarks/run.py --save-baseline")
+            sys.exit(2)
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_tools(directory)
+        for size in args.sizes:
+            # the JSON benchmarks do not depend on the table size, run them once
+            bench_messages(directory, size, with_json=size == min(args.sizes))
+
+    if args.compare:
+        print(f"\nCompared with the baseline from {baseline['created']} ({baseline['machine']}):")
+        regressions = compare(baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) got more than {args.threshold:.0%} slower")
+            sys.exit(1)
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as baseline_file:
+            json.dump({
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "machine": f"{platform.node()} {platform.machine()}, Python {platform.python_version()}, SQLite {sqlite3.sqlite_version}",
+                "results": results,
+            }, baseline_file, indent=2)
+        print(f"Saved baseline to {BASELINE_PATH}")
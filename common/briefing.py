@@ -0,0 +1,88 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from common import fetchers
+
+# Order of the sections in the briefing
+SECTIONS = ("quote", "weather", "news")
+
+# Seconds each source gets, counted from when the briefing started
+DEFAULT_DEADLINES = {"quote": 3, "weather": 5, "news": 5}
+
+# What a missing section says when mark_missing is set
+MISSING_TEXT = {
+    "quote": "The quote of the day is not available right now.",
+    "weather": "The weather is not available right now.",
+    "news": "The news is not available right now.",
+}
+
+fetch_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="briefing")
+
+
+def start_sections(city, country='us', category='general', page_size=5):
+    """Starts all fetches of one briefing at once and returns their futures by section."""
+    return {
+        "quote": fetch_executor.submit(fetchers.get_random_quote),
+        "weather": fetch_executor.submit(fetchers.get_weather, city),
+        "news": fetch_executor.submit(fetchers.get_top_headlines, country, category, page_size),
+    }
+
+
+def time_left(name, started, deadlines=None):
+    deadlines = deadlines or DEFAULT_DEADLINES
+    return max(0, started + deadlines.get(name, DEFAULT_DEADLINES[name]) - time.monotonic())
+
+
+def wait_sections(futures, started, deadlines=None):
+    """Waits for each section until its deadline. A source that is slow, fails or
+    returns nothing gives None instead of holding up or breaking the briefing."""
+    sections = {}
+    for name in SECTIONS:
+        try:
+            sections[name] = futures[name].result(timeout=time_left(name, started, deadlines)) or None
+        except TimeoutError:
+            print(f"Briefing: {name} did not arrive in time, skipping it")
+            futures[name].cancel()
+            sections[name] = None
+        except Exception as e:
+            print(f"Briefing: {name} failed, skipping it: {e}")
+            sections[name] = None
+    return sections
+
+
+def fetch_sections(city, country='us', category='general', page_size=5, deadlines=None):
+    """The quote, weather and news texts for one briefing, fetched concurrently. Missing ones are None."""
+    started = time.monotonic()
+    return wait_sections(start_sections(city, country, category, page_size), started, deadlines)
+
+
+def briefing_text(sections, mark_missing=False):
+    """Joins the sections in order, leaving out missing ones or saying they are missing."""
+    parts = []
+    for name in SECTIONS:
+        text = sections.get(name)
+        if text:
+            parts.append(text.strip())
+        elif mark_missing:
+            parts.append(MISSING_TEXT[name])
+    return "\n".join(parts)
+
+
+def build_briefing(city, country='us', category='general', page_size=5, deadlines=None, mark_missing=False):
+    """The daily briefing for one city: quote, weather and headlines, one per line."""
+    return briefing_text(fetch_sections(city, country, category, page_size, deadlines), mark_missing)
+
+
+def build_briefings(cities, country='us', category='general', page_size=5, deadlines=None, mark_missing=False):
+    """Briefings for many cities at once, by city. Every fetch starts before any is waited on,
+    and the quote and news are fetched once and shared by all cities."""
+    started = time.monotonic()
+    shared = {
+        "quote": fetch_executor.submit(fetchers.get_random_quote),
+        "news": fetch_executor.submit(fetchers.get_top_headlines, country, category, page_size),
+    }
+    futures = {city: dict(shared, weather=fetch_executor.submit(fetchers.get_weather, city)) for city in cities}
+    return {
+        city: briefing_text(wait_sections(city_futures, started, deadlines), mark_missing)
+        for city, city_futures in futures.items()
+    }
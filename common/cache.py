@@ -0,0 +1,145 @@
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Every cache made by cached() is registered here, so stats can be reported in one place
+caches = {}
+
+# Background refreshes for stale entries
+refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+
+
+def is_cacheable(value):
+    # the fetchers return None or '' when the upstream call failed, never keep those
+    return value is not None and value != ''
+
+
+class TTLCache:
+    """Thread-safe LRU cache where every entry expires after its own TTL.
+
+    An entry older than its TTL but younger than TTL + stale_ttl is still served,
+    while a background refresh loads a new value (stale-while-revalidate).
+    """
+
+    def __init__(self, maxsize=128, ttl=300, stale_ttl=0, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        # key -> (value, fresh_until, stale_until), least recently used first
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def set(self, key, value, ttl=None, stale_ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + ttl, now + ttl + stale_ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, default=None):
+        """Returns the fresh value for key, or default. Does not count as a hit or miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or time.monotonic() >= entry[1]:
+                return default
+            return entry[0]
+
+    def invalidate(self, key=None):
+        """Drops one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Returns the cached value for key, calling loader() to fill the cache when needed."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and now < entry[2]:
+                self._data.move_to_end(key)
+                if now < entry[1]:
+                    self.hits += 1
+                    return entry[0]
+                # stale but usable, refresh it in the background
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    refresh_executor.submit(self._refresh, key, loader, ttl)
+                return entry[0]
+            self.misses += 1
+
+        value = loader()
+        if is_cacheable(value):
+            self.set(key, value, ttl)
+        return value
+
+    def _refresh(self, key, loader, ttl):
+        try:
+            value = loader()
+            if is_cacheable(value):
+                self.set(key, value, ttl)
+                with self._lock:
+                    self.refreshes += 1
+        except Exception as e:
+            # keep serving the stale value, the next stale hit retries
+            print(f"Background refresh of {self.name or 'cache'} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+            }
+
+
+def cached(ttl, stale_ttl=0, maxsize=128, name=None):
+    """Caches a function's results per argument set, see TTLCache.
+
+    Arguments are bound to the signature first, so get_top_headlines('us') and
+    get_top_headlines(country='us', category='general') share one entry.
+    """
+    def decorator(fn):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl, stale_ttl=stale_ttl, name=name or fn.__name__)
+        caches[cache.name] = cache
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments.items())
+            return cache.get_or_load(key, lambda: fn(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
+
+
+def stats():
+    """Hit/miss counters of every registered cache, keyed by cache name."""
+    return {name: cache.stats() for name, cache in caches.items()}
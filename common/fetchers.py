@@ -0,0 +1,97 @@
+import json
+import os
+
+import requests
+
+from common import http_client
+from common.cache import cached
+
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.json')
+with open(config_path) as config_file:
+    config = json.load(config_file)
+
+NEWS_API_KEY = config['NEWS_API_KEY']
+NEWS_BASE_URL = config['NEWS_BASE_URL']
+
+WEATHER_API_KEY = config.get('WEATHER_API_KEY')
+WEATHER_BASE_URL = config.get('WEATHER_BASE_URL')
+
+QUOTE_BASE_URL = config['QUOTE_BASE_URL']
+
+
+# a new quote at most once a minute, zenquotes rate limits the random endpoint
+@cached(ttl=60, stale_ttl=300)
+def get_random_quote():
+    """Returns "quote - author", or None if the quote could not be fetched."""
+    try:
+        response = http_client.get(QUOTE_BASE_URL)
+    except requests.RequestException as e:
+        print("Error fetching quote data:", e)
+        return None
+
+    if response.status_code == 200:
+        data = response.json()
+
+        quoteData = data[0]['q']
+        authorData = data[0]['a']
+        return quoteData + ' - ' + authorData + '\n'
+    else:
+        print("Error fetching quote data:", response.status_code)
+        return None
+
+
+# weather changes slowly, refresh it every 10 minutes
+@cached(ttl=600, stale_ttl=900)
+def get_weather(city, aqi='no'):
+    """Returns the current weather for city as text, or '' if it could not be fetched."""
+    params = {
+        'key': WEATHER_API_KEY,
+        'q': city,
+        'aqi': aqi
+    }
+    try:
+        response = http_client.get(WEATHER_BASE_URL, params=params)
+    except requests.RequestException as e:
+        print("Error fetching weather data:", e)
+        return ''
+
+    if response.status_code == 200:
+        data = response.json()
+        current = data['current']
+
+        return f"Weather: Temperature: {current['temp_c']}°C, Condition: {current['condition']['text']}, Humidity: {current['humidity']}%\n"
+    else:
+        print("Error fetching weather data:", response.status_code)
+        return ''
+
+
+# headlines per (country, category) change every few minutes, this also keeps us under the NewsAPI limits
+@cached(ttl=300, stale_ttl=600)
+def get_top_headlines(country='us', category='general', page_size=5):
+    """Returns a heading plus one headline per line, or None if the news could not be fetched."""
+    #Params for news
+    params = {
+        'apiKey': NEWS_API_KEY,
+        'country': country,
+        'category': category,
+        'pageSize': page_size
+    }
+    try:
+        response = http_client.get(NEWS_BASE_URL, params=params)
+    except requests.RequestException as e:
+        print(f"Failed to fetch news: {e}")
+        return None
+
+    if response.status_code == 200:
+        data = response.json()
+        articles = data.get('articles', [])
+        titles = [article['title'] for article in articles if article['title'] != '[Removed]']
+
+        if titles:
+            news = f"Top {category.capitalize()} News Headlines in {country.upper()}:\n"
+            return news + '\n'.join(titles) + '\n'
+        else:
+            return "No news articles found."
+    else:
+        print(f"Failed to fetch news. Status code: {response.status_code}")
+        return None
@@ -0,0 +1,31 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds, so a stalled upstream can not hang a run
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Connections per host kept alive between calls
+POOL_SIZE = 20
+
+# One session for the whole process: TCP/TLS connections are pooled and reused
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=10, pool_maxsize=POOL_SIZE)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+
+def get(url, params=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """requests.get through the shared keep-alive session, always with a timeout."""
+    return session.get(url, params=params, timeout=timeout, **kwargs)
+
+
+def make_async_client(timeout=DEFAULT_TIMEOUT):
+    """httpx.AsyncClient with the same pooling and timeouts, for code running on an event loop."""
+    # imported here so the sync task scripts do not need httpx
+    import httpx
+
+    connect, read = timeout
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(read, connect=connect),
+        limits=httpx.Limits(max_connections=POOL_SIZE * 2, max_keepalive_connections=POOL_SIZE),
+    )
@@ -0,0 +1,142 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import briefing, fetchers, tts_cache
+
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.json')
+with open(config_path) as config_file:
+    config = json.load(config_file)
+
+# Spoken versions of the pre-computed texts, inside the TTS cache so they count towards its size cap
+ARTIFACT_DIR = os.path.join(tts_cache.CACHE_DIR, "scheduled")
+
+
+class Scheduler:
+    """Refreshes texts and their audio in the background, so they are ready before anyone asks.
+
+    Every job runs once per interval, at the same clock times like a cron "*/N"
+    entry, plus a random jitter so jobs (and processes) do not all hit the APIs
+    in the same second. At most max_concurrency jobs run at once.
+    """
+
+    def __init__(self, interval=1800, jitter=60, max_concurrency=2):
+        self.interval = interval
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        # key -> (function returning the text, time of the next run)
+        self._jobs = {}
+        self._running = set()
+        # key -> {"text", "audio_path", "updated_at"}
+        self.artifacts = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def add(self, key, fn):
+        # the first run is spread over the first jitter window instead of waiting a whole interval
+        with self._lock:
+            self._jobs[key] = (fn, time.time() + random.uniform(0, self.jitter))
+        self._wakeup.set()
+
+    def get(self, key, max_age=None):
+        """The latest artifact for key, or None if there is none younger than max_age
+        (two intervals by default, so one failed refresh does not drop it)."""
+        max_age = self.interval * 2 if max_age is None else max_age
+        artifact = self.artifacts.get(key)
+        if artifact is None or time.time() - artifact["updated_at"] > max_age:
+            return None
+        return artifact
+
+    def next_run(self):
+        """The next aligned tick after now, with jitter."""
+        now = time.time()
+        return now - now % self.interval + self.interval + random.uniform(0, self.jitter)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="scheduler")
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            now = time.time()
+            with self._lock:
+                due = [key for key, (_, run_at) in self._jobs.items() if run_at <= now and key not in self._running]
+                for key in due:
+                    fn, _ = self._jobs[key]
+                    self._jobs[key] = (fn, self.next_run())
+                    self._running.add(key)
+                    self._executor.submit(self._refresh, key, fn)
+                next_at = min((run_at for _, run_at in self._jobs.values()), default=now + self.interval)
+            self._wakeup.wait(timeout=max(0, next_at - time.time()))
+            self._wakeup.clear()
+
+    def _refresh(self, key, fn):
+        try:
+            text = fn()
+            if not text:
+                # keep serving the previous artifact
+                print(f"Scheduler: {key} returned nothing, keeping the previous version")
+                return
+            audio_path = tts_cache.save_speech(text, ARTIFACT_DIR)
+            self.artifacts[key] = {"text": text, "audio_path": audio_path, "updated_at": time.time()}
+        except Exception as e:
+            print(f"Scheduler: refreshing {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(key)
+
+
+def from_config(briefings=True):
+    """A Scheduler for the "briefing_schedule" section of config.json, or None if it is disabled.
+
+    Pass briefings=False when only the separate quote, weather and news are
+    served, so no whole briefings are fetched and spoken that nobody asks for.
+
+    Defaults match what the task scripts ask for:
+    {"cities": ["Liepaja", "Latvia"], "news": [["us", "general"]],
+     "interval_minutes": 30, "jitter_seconds": 60, "max_concurrency": 2}
+    """
+    settings = config.get('briefing_schedule', {})
+    if not settings.get('enabled', True):
+        return None
+
+    scheduler = Scheduler(
+        interval=settings.get('interval_minutes', 30) * 60,
+        jitter=settings.get('jitter_seconds', 60),
+        max_concurrency=settings.get('max_concurrency', 2),
+    )
+    cities = settings.get('cities', ["Liepaja", "Latvia"])
+    news = [tuple(pair) for pair in settings.get('news', [["us", "general"]])]
+
+    scheduler.add(("quote",), fetchers.get_random_quote)
+    for city in cities:
+        scheduler.add(("weather", city), lambda city=city: fetchers.get_weather(city))
+    for country, category in news:
+        scheduler.add(("news", country, category),
+                      lambda country=country, category=category: fetchers.get_top_headlines(country, category))
+    if not briefings:
+        return scheduler
+    for city in cities:
+        for country, category in news:
+            scheduler.add(("briefing", city, country, category),
+                          lambda city=city, country=country, category=category:
+                          briefing.build_briefing(city, country, category))
+    return scheduler
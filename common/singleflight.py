@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class Group:
+    """Runs a function once per key at a time, however many callers ask for it at once.
+
+    The first caller for a key runs fn; everyone who asks for the same key while
+    it runs waits for that call and gets the same result (or exception). The next
+    call after it finished runs fn again, so nothing is cached here.
+
+    Threads use do(), coroutines use do_async(), and both share the same calls:
+    a coroutine can wait for a call started by a thread and the other way round.
+    """
+
+    def __init__(self):
+        # key -> Future of the call in flight
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def _join(self, key):
+        """The future for key and whether the caller has to run the call itself."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.calls += 1
+            return future, True
+
+    def _run(self, key, future, fn):
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+        else:
+            self._finish(key)
+            future.set_result(result)
+
+    def _finish(self, key):
+        # callers arriving from now on start a new call instead of getting this result
+        with self._lock:
+            del self._calls[key]
+
+    def do(self, key, fn):
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn)
+        return future.result()
+
+    async def do_async(self, key, fn):
+        """do() for the event loop: fn (blocking) runs in a thread and waiting does not hold one.
+
+        A cancelled caller stops waiting, but the call still finishes for the others.
+        """
+        future, leader = self._join(key)
+        if leader:
+            asyncio.get_running_loop().run_in_executor(None, self._run, key, future, fn)
+        # shielded, so a cancelled caller does not cancel the call everyone else waits for
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
@@ -0,0 +1,25 @@
+import sqlite3
+
+
+def match_expression(text):
+    """Turns free text into an FTS5 query: every word must match, as a prefix.
+
+    Quoting each word keeps FTS5 operators and punctuation in user input from
+    being parsed as query syntax.
+    """
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+def migrate(connection, migrations, name="database"):
+    """Brings the schema up to date: applies the scripts in migrations that are newer
+    than PRAGMA user_version, in order, each in its own transaction."""
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(migrations[version:], start=version + 1):
+        # executescript commits on its own, so the version bump goes in the same script
+        try:
+            connection.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except sqlite3.Error:
+            if connection.in_transaction:
+                connection.rollback()
+            raise
+        print(f"Applied {name} migration {number}")
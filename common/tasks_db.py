@@ -0,0 +1,210 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Annotated, TypedDict
+
+from common.sqlite_util import match_expression, migrate
+
+
+class TaskStatusUpdate(TypedDict):
+    task_id: Annotated[int, "The ID of the task to update"]
+    new_status: Annotated[str, "The new status of the task (e.g., 'completed', 'pending')"]
+
+
+# Schema changes, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    # 1: the table as Task_4 created it
+    '''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task TEXT,
+        status TEXT DEFAULT 'pending'
+    );
+    ''',
+    # 2: status filter index and a full-text index over the task text, kept in sync by triggers
+    '''
+    CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(task, content='tasks', content_rowid='id');
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, task) VALUES (new.id, new.task);
+    END;
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, task) VALUES ('delete', old.id, old.task);
+    END;
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF task ON tasks BEGIN
+        INSERT INTO tasks_fts (tasks_fts, rowid, task) VALUES ('delete', old.id, old.task);
+        INSERT INTO tasks_fts (rowid, task) VALUES (new.id, new.task);
+    END;
+    INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild');
+    ''',
+]
+
+# Most tasks returned by one get_tasks call
+MAX_PAGE_SIZE = 200
+
+
+class TaskStore:
+    """The to-do list table behind one long-lived connection.
+
+    Tool calls run on worker threads, so the connection is shared between them
+    and every transaction holds a lock. Bulk operations use executemany and
+    commit once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # committed write transactions on this connection, see version()
+        self.changes = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        migrate(self.connection, MIGRATIONS, "tasks")
+
+    @contextmanager
+    def transaction(self):
+        """One transaction on the shared connection, committed on success."""
+        with self.lock:
+            with self.connection:
+                yield self.connection
+            self.changes += 1
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def version(self):
+        """A value that changes whenever the tasks change, here or through another connection.
+
+        PRAGMA data_version only moves for commits made by other connections, so
+        our own commits are counted separately.
+        """
+        with self.lock:
+            return self.changes, self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def existing_ids(self, connection, task_ids):
+        placeholders = ", ".join("?" * len(task_ids))
+        rows = connection.execute(f'SELECT id FROM tasks WHERE id IN ({placeholders})', task_ids)
+        return {row[0] for row in rows}
+
+    def add_tasks(self, tasks, status='pending'):
+        """Inserts all tasks in one transaction and returns their new ids."""
+        with self.transaction() as connection:
+            cursor = connection.executemany(
+                'INSERT INTO tasks (task, status) VALUES (?, ?)',
+                [(task, status) for task in tasks]
+            )
+            # ids are handed out in order and nobody else can write inside our transaction
+            last_id = connection.execute('SELECT last_insert_rowid()').fetchone()[0]
+        return list(range(last_id - cursor.rowcount + 1, last_id + 1))
+
+    def update_tasks_status(self, updates):
+        """Applies (task_id, new_status) pairs in one transaction, returns the ids that did not exist."""
+        with self.transaction() as connection:
+            missing = set(task_id for task_id, _ in updates) - self.existing_ids(connection, [task_id for task_id, _ in updates])
+            connection.executemany(
+                'UPDATE tasks SET status = ? WHERE id = ?',
+                [(new_status, task_id) for task_id, new_status in updates]
+            )
+        return sorted(missing)
+
+    def delete_tasks(self, task_ids):
+        """Deletes the tasks in one transaction, returns the ids that did not exist."""
+        with self.transaction() as connection:
+            missing = set(task_ids) - self.existing_ids(connection, task_ids)
+            connection.executemany('DELETE FROM tasks WHERE id = ?', [(task_id,) for task_id in task_ids])
+        return sorted(missing)
+
+    def get_tasks(self, status=None, query=None, limit=50, after_id=None):
+        """Returns (rows, has_more) for one page of tasks in id order.
+
+        status filters on the exact status, query is a full-text search over the
+        task text and after_id continues after the last id of the previous page.
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conditions = []
+        params = []
+        if query and query.strip():
+            sql = 'SELECT t.id, t.task, t.status FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid'
+            conditions.append('tasks_fts MATCH ?')
+            params.append(match_expression(query))
+        else:
+            sql = 'SELECT t.id, t.task, t.status FROM tasks t'
+        if status:
+            conditions.append('t.status = ?')
+            params.append(status)
+        if after_id is not None:
+            conditions.append('t.id > ?')
+            params.append(after_id)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        # one extra row tells us whether there is another page
+        sql += ' ORDER BY t.id LIMIT ?'
+        params.append(limit + 1)
+
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return rows[:limit], len(rows) > limit
+
+
+def register_task_tools(registry, store):
+    """Registers the to-do list tools, backed by store, on a ToolRegistry."""
+
+    @registry.tool(writes=True)
+    def add_tasks(tasks: Annotated[list[str], "The tasks to add, one entry per task"]):
+        """Add one or more tasks to the to-do list"""
+        if not tasks:
+            return "No tasks given."
+        ids = store.add_tasks(tasks)
+        return "Added tasks:\n" + "".join(f"{task_id}: {task}\n" for task_id, task in zip(ids, tasks))
+
+    @registry.tool(state=store.version)
+    def get_tasks_from_db(
+        status: Annotated[str | None, "Only return tasks with this status (e.g., 'completed', 'pending')"] = None,
+        query: Annotated[str | None, "Only return tasks whose text contains these words"] = None,
+        limit: Annotated[int, f"How many tasks to return, at most {MAX_PAGE_SIZE}"] = 50,
+        after_id: Annotated[int | None, "Continue after this task ID, to get the next page"] = None,
+    ):
+        """Retrieve tasks from the to-do list, optionally filtered by status or text, one page at a time"""
+        tasks, has_more = store.get_tasks(status, query, limit, after_id)
+        if tasks:
+            output = "Here are your tasks:\n"
+            for task_id, task, status in tasks:
+                output += f"{task_id}: {task} - {status}\n"
+            if has_more:
+                output += f"There are more tasks, call again with after_id={tasks[-1][0]} to see them.\n"
+            return output
+        elif status or query or after_id is not None:
+            return "No matching tasks."
+        else:
+            return "Your to-do list is empty."
+
+    @registry.tool(writes=True)
+    def update_tasks_status(updates: Annotated[list[TaskStatusUpdate], "The tasks to update and their new status"]):
+        """Update the status of one or more tasks in the to-do list"""
+        if not updates:
+            return "No tasks given."
+        # one update per task, in the order given; the last status given for a task wins
+        pairs = list({update['task_id']: update['new_status'] for update in updates}.items())
+        print(f"Updating task status: {pairs}")
+        missing = store.update_tasks_status(pairs)
+        output = "".join(f"Task {task_id} status updated to '{new_status}'.\n"
+                         for task_id, new_status in pairs if task_id not in missing)
+        if missing:
+            output += f"No tasks with ID {', '.join(map(str, missing))}.\n"
+        return output
+
+    @registry.tool(writes=True)
+    def delete_tasks(task_ids: Annotated[list[int], "The IDs of the tasks to delete"]):
+        """Delete one or more tasks from the to-do list"""
+        if not task_ids:
+            return "No tasks given."
+        # each task once, in the order given
+        task_ids = list(dict.fromkeys(task_ids))
+        print(f"Deleting tasks {task_ids}")
+        missing = store.delete_tasks(task_ids)
+        deleted = [task_id for task_id in task_ids if task_id not in missing]
+        output = f"Deleted tasks {', '.join(map(str, deleted))}.\n" if deleted else ""
+        if missing:
+            output += f"No tasks with ID {', '.join(map(str, missing))}.\n"
+        return output
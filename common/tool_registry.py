@@ -0,0 +1,242 @@
+import asyncio
+import inspect
+import json
+import types
+import typing
+from typing import Annotated, Literal, get_args, get_origin, get_type_hints
+
+from common.singleflight import Group
+
+JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    dict: "object",
+}
+
+
+# Identical calls of single_flight tools in flight at the same time, shared by every registry
+flights = Group()
+
+
+class ToolError(Exception):
+    """The assistant called a tool that does not exist, or with bad arguments."""
+
+
+def type_schema(hint):
+    """JSON schema for a type hint: str, int, float, bool, list[...], Literal[...], TypedDict, Optional[...]."""
+    description = None
+    if get_origin(hint) is Annotated:
+        hint, *extras = get_args(hint)
+        description = next((extra for extra in extras if isinstance(extra, str)), None)
+
+    origin = get_origin(hint)
+    if origin in (typing.Union, types.UnionType):
+        # Optional[X] is X that may be left out
+        options = [arg for arg in get_args(hint) if arg is not type(None)]
+        schema = type_schema(options[0])
+    elif origin is Literal:
+        values = list(get_args(hint))
+        schema = {"type": JSON_TYPES[type(values[0])], "enum": values}
+    elif origin is list:
+        (item,) = get_args(hint) or (str,)
+        schema = {"type": "array", "items": type_schema(item)}
+    elif typing.is_typeddict(hint):
+        hints = get_type_hints(hint, include_extras=True)
+        schema = {
+            "type": "object",
+            "properties": {name: type_schema(field) for name, field in hints.items()},
+            "required": [name for name in hints if name in hint.__required_keys__],
+        }
+    elif hint in JSON_TYPES:
+        schema = {"type": JSON_TYPES[hint]}
+    else:
+        raise TypeError(f"Can not describe {hint!r} as a tool parameter")
+
+    if description:
+        schema["description"] = description
+    return schema
+
+
+def check_value(name, value, schema):
+    """Raises ToolError when value does not match schema."""
+    expected = schema["type"]
+    if expected == "integer":
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    elif expected == "number":
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif expected == "string":
+        valid = isinstance(value, str)
+    elif expected == "boolean":
+        valid = isinstance(value, bool)
+    elif expected == "array":
+        valid = isinstance(value, list)
+    else:
+        valid = isinstance(value, dict)
+    if not valid:
+        raise ToolError(f"'{name}' must be of type {expected}")
+
+    if "enum" in schema and value not in schema["enum"]:
+        raise ToolError(f"'{name}' must be one of {schema['enum']}")
+    if expected == "array":
+        for index, item in enumerate(value):
+            check_value(f"{name}[{index}]", item, schema["items"])
+    elif expected == "object" and "properties" in schema:
+        check_arguments(name, value, schema)
+
+
+def check_arguments(name, arguments, schema):
+    properties = schema["properties"]
+    unknown = [key for key in arguments if key not in properties]
+    if unknown:
+        raise ToolError(f"Unknown argument(s) for {name}: {', '.join(unknown)}")
+    missing = [key for key in schema["required"] if key not in arguments]
+    if missing:
+        raise ToolError(f"Missing argument(s) for {name}: {', '.join(missing)}")
+    for key, value in arguments.items():
+        if value is None and key not in schema["required"]:
+            # null for an optional argument means "use the default"
+            continue
+        check_value(key, value, properties[key])
+
+
+class Tool:
+    """One registered tool.
+
+    What a tool declares about its output is used to decide whether an answer
+    built from it may be reused: writes marks tools that change data, max_age is
+    how many seconds the output stays valid and state is a function returning a
+    value that changes whenever the data the tool reads changes.
+
+    single_flight lets identical calls made at the same time share one call and
+    its result. Only for tools that read from an upstream API: a local read
+    joined this way could miss a write committed after it started.
+    """
+
+    def __init__(self, fn, description=None, timeout=None, writes=False, max_age=None, state=None,
+                 single_flight=False):
+        self.fn = fn
+        self.name = fn.__name__
+        self.timeout = timeout
+        self.writes = writes
+        self.max_age = max_age
+        self.state = state
+        self.single_flight = single_flight
+        description = description or inspect.getdoc(fn) or ""
+
+        hints = get_type_hints(fn, include_extras=True)
+        self.signature = inspect.signature(fn)
+        properties = {}
+        required = []
+        for param in self.signature.parameters.values():
+            schema = type_schema(hints.get(param.name, str))
+            if param.default is inspect.Parameter.empty:
+                required.append(param.name)
+            elif param.default is not None:
+                schema["default"] = param.default
+            properties[param.name] = schema
+
+        self.parameters = {"type": "object", "properties": properties, "required": required}
+        self.schema = {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": description,
+                "parameters": self.parameters,
+            },
+        }
+
+    def parse_arguments(self, arguments):
+        """Parses the JSON arguments of a tool call once and checks them against the schema."""
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            except json.JSONDecodeError as e:
+                raise ToolError(f"Arguments for {self.name} are not valid JSON: {e}")
+        if not isinstance(arguments, dict):
+            raise ToolError(f"Arguments for {self.name} must be a JSON object")
+        check_arguments(self.name, arguments, self.parameters)
+        required = self.parameters["required"]
+        return {key: value for key, value in arguments.items() if value is not None or key in required}
+
+    def flight_key(self, arguments):
+        """Calls with the same key can share one result: same function, same arguments once
+        the defaults are filled in. None unless the tool is single_flight, those always run."""
+        if not self.single_flight or self.writes:
+            return None
+        bound = self.signature.bind(**arguments)
+        bound.apply_defaults()
+        return self.fn, json.dumps(bound.arguments, sort_keys=True, separators=(",", ":"))
+
+
+class ToolRegistry:
+    """Tools the assistant may call, with their JSON schemas generated from type hints.
+
+    The tool description is the function's docstring. Parameter descriptions come
+    from Annotated[type, "description"], enums from Literal and defaults from the
+    signature. Calls are dispatched by name with a dict lookup.
+
+    Identical calls of single_flight tools, made while one is already running,
+    wait for that one instead of calling the upstream API again.
+    """
+
+    def __init__(self):
+        self._tools = {}
+        self._schemas = []
+
+    def tool(self, fn=None, *, description=None, timeout=None, writes=False, max_age=None, state=None,
+             single_flight=False):
+        """Decorator that registers fn as a tool. Can be used with or without arguments."""
+        def register(fn):
+            self.add(Tool(fn, description, timeout, writes, max_age, state, single_flight))
+            return fn
+
+        return register(fn) if fn is not None else register
+
+    def add(self, tool):
+        if tool.name in self._tools:
+            raise ValueError(f"Tool {tool.name} is already registered")
+        self._tools[tool.name] = tool
+        self._schemas.append(tool.schema)
+
+    def copy(self):
+        """A new registry with the same tools, to add more tools to."""
+        registry = ToolRegistry()
+        for tool in self._tools.values():
+            registry.add(tool)
+        return registry
+
+    def get(self, name):
+        tool = self._tools.get(name)
+        if tool is None:
+            raise ToolError(f"Unknown tool: {name}")
+        return tool
+
+    def schemas(self):
+        """The tools list for assistants.create / chat.completions.create."""
+        return list(self._schemas)
+
+    def call(self, name, arguments):
+        """Looks the tool up by name, validates its JSON arguments and calls it."""
+        tool = self.get(name)
+        arguments = tool.parse_arguments(arguments)
+        key = tool.flight_key(arguments)
+        if key is None:
+            return tool.fn(**arguments)
+        return flights.do(key, lambda: tool.fn(**arguments))
+
+    async def call_async(self, name, arguments):
+        """call() for the event loop: the tool runs in a thread, a shared call is awaited without one."""
+        tool = self.get(name)
+        arguments = tool.parse_arguments(arguments)
+        key = tool.flight_key(arguments)
+        if key is None:
+            return await asyncio.to_thread(tool.fn, **arguments)
+        return await flights.do_async(key, lambda: tool.fn(**arguments))
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def __iter__(self):
+        return iter(self._tools.values())
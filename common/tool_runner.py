@@ -0,0 +1,76 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from common.tool_registry import ToolError
+
+# Seconds a tool may take before the assistant is told it timed out, unless the tool sets its own
+DEFAULT_TOOL_TIMEOUT = 10
+
+
+class ToolRunner:
+    """Runs the tool calls an assistant asks for against a ToolRegistry and turns
+    the results, bad calls, failures and timeouts into outputs for submit_tool_outputs.
+
+    A failing tool never fails the run: the assistant gets an "Error: ..." output
+    instead, so it can correct the call or answer without it.
+    """
+
+    def __init__(self, registry, default_timeout=DEFAULT_TOOL_TIMEOUT, max_workers=8):
+        self.registry = registry
+        self.default_timeout = default_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tools")
+
+    def timeout(self, name):
+        if name in self.registry and self.registry.get(name).timeout:
+            return self.registry.get(name).timeout
+        return self.default_timeout
+
+    def execute(self, tool_call):
+        """Runs the local function the assistant asked for and returns its output."""
+        name = tool_call.function.name
+        print(f"  {name} called")
+        try:
+            # one dict lookup, arguments parsed and checked once
+            return self.registry.call(name, tool_call.function.arguments)
+        except ToolError as e:
+            # tell the assistant what was wrong, so it can correct the call
+            print(f"  {e}")
+            return f"Error: {e}"
+
+    async def execute_async(self, tool_call):
+        """execute() for the event loop, where waiting for an identical call already in flight does not take a thread."""
+        name = tool_call.function.name
+        print(f"  {name} called")
+        try:
+            return await self.registry.call_async(name, tool_call.function.arguments)
+        except ToolError as e:
+            print(f"  {e}")
+            return f"Error: {e}"
+
+    def error_output(self, name, error):
+        """Output handed to the assistant when a tool failed, so the run can still finish."""
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+            print(f"  {name} timed out after {self.timeout(name)}s")
+            return f"Error: {name} did not respond within {self.timeout(name)} seconds."
+        print(f"  {name} failed: {error}")
+        return f"Error: {name} failed: {error}"
+
+    def run_all(self, tool_calls):
+        """Runs all tool calls of a run at the same time, so the run waits for the slowest
+        tool instead of the sum of them. Returns the outputs for one submission."""
+        started = time.monotonic()
+        futures = [(tool_call, self.executor.submit(self.execute, tool_call)) for tool_call in tool_calls]
+
+        tool_outputs = []
+        for tool_call, future in futures:
+            name = tool_call.function.name
+            try:
+                output = future.result(timeout=max(0, started + self.timeout(name) - time.monotonic()))
+            except Exception as e:
+                output = self.error_output(name, e)
+            tool_outputs.append({
+                "tool_call_id": tool_call.id,
+                "output": str(output)
+            })
+        return tool_outputs
@@ -0,0 +1,26 @@
+from typing import Annotated, Literal
+
+from common import fetchers
+from common.tool_registry import ToolRegistry
+
+NEWS_CATEGORIES = Literal["general", "business", "entertainment", "health", "science", "sports", "technology"]
+
+# Tools every assistant task offers. Tasks take a copy and register their own tools on it.
+shared_tools = ToolRegistry()
+
+
+# the output is as fresh as the fetcher cache it comes from; identical calls at the same time
+# share one upstream request
+@shared_tools.tool(timeout=5, max_age=fetchers.get_random_quote.cache.ttl, single_flight=True)
+def get_random_quote():
+    """Fetches a random quote and author"""
+    return fetchers.get_random_quote()
+
+
+@shared_tools.tool(timeout=10, max_age=fetchers.get_top_headlines.cache.ttl, single_flight=True)
+def get_top_headlines(
+    country: Annotated[str, "The 2-letter country code (ISO 3166-1) for which you want to get the news headlines. Default is 'us'"] = 'us',
+    category: Annotated[NEWS_CATEGORIES, "The category of news to fetch, such as 'general', 'business', 'entertainment', 'health', 'science', 'sports', or 'technology'. Default is 'general'."] = 'general',
+):
+    """Fetches the top news headlines for a given country and category."""
+    return fetchers.get_top_headlines(country, category)
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from gtts import gTTS
+
+config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.json')
+with open(config_path) as config_file:
+    config = json.load(config_file)
+
+# Synthesized segments, one MP3 per (text, language, voice), shared by all tasks
+CACHE_DIR = config.get('tts_cache_dir') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.tts-cache')
+CACHE_MAX_BYTES = config.get('tts_cache_max_mb', 200) * 1024 * 1024
+
+# Assembled MP3s of whole texts, inside the cache so the size cap covers them too
+SPEECH_DIR = os.path.join(CACHE_DIR, 'speech')
+
+# gTTS makes one HTTP request per ~100 characters, so segments are synthesized side by side
+synthesis_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tts")
+
+_evict_lock = threading.Lock()
+
+
+def split_segments(text):
+    """One segment per non-empty line, so every headline or quote is cached on its own."""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def segment_key(text, lang='en', tld='com'):
+    # tld picks the Google host, which is what changes the accent
+    return hashlib.sha256(f"{lang}\0{tld}\0{text}".encode('utf-8')).hexdigest()
+
+
+def segment_path(text, lang='en', tld='com'):
+    key = segment_key(text, lang, tld)
+    return os.path.join(CACHE_DIR, key[:2], key + '.mp3')
+
+
+def write_atomic(path, write):
+    """Calls write(file) on a temporary file next to path, then renames it into place."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            write(file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def synthesize_segment(text, lang='en', tld='com'):
+    """Returns the path of the MP3 for text, synthesizing it only if it is not cached yet."""
+    path = segment_path(text, lang, tld)
+    if os.path.exists(path):
+        # the modification time doubles as the last-used time for eviction
+        os.utime(path)
+        return path
+
+    write_atomic(path, gTTS(text, lang=lang, tld=tld).write_to_fp)
+    evict()
+    return path
+
+
+def synthesize(segments, lang='en', tld='com'):
+    """Synthesizes all segments in parallel and returns their MP3 paths, in order."""
+    segments = [segment for segment in segments if segment]
+    return list(synthesis_executor.map(lambda segment: synthesize_segment(segment, lang, tld), segments))
+
+
+def strip_id3(data):
+    """MP3 data without a leading ID3v2 tag, which may not appear in the middle of a stream."""
+    if data[:3] != b'ID3' or len(data) < 10:
+        return data
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return data[10 + size:]
+
+
+def assemble(paths, output_path):
+    """Concatenates the MP3 frames of the segment files into output_path."""
+    def write(file):
+        for index, path in enumerate(paths):
+            with open(path, 'rb') as segment:
+                data = segment.read()
+            file.write(data if index == 0 else strip_id3(data))
+
+    write_atomic(output_path, write)
+    return output_path
+
+
+def speech_path(segments, output_dir=SPEECH_DIR, lang='en', tld='com'):
+    """Where the assembled MP3 for segments goes. The name is derived from the content,
+    so different texts never overwrite each other and the same text is not assembled twice."""
+    key = segment_key('\n'.join(segments), lang, tld)
+    return os.path.join(output_dir, f"speech-{key[:16]}.mp3")
+
+
+def save_speech(text, output_dir=SPEECH_DIR, lang='en', tld='com'):
+    """Speaks text into an MP3 in output_dir and returns its path, or None when there is nothing to say."""
+    segments = split_segments(text)
+    if not segments:
+        return None
+    output_path = speech_path(segments, output_dir, lang, tld)
+    try:
+        # mark it as recently used, so eviction removes other files first
+        os.utime(output_path)
+        return output_path
+    except FileNotFoundError:
+        pass
+    assemble(synthesize(segments, lang, tld), output_path)
+    evict()
+    return output_path
+
+
+def evict():
+    """Deletes the least recently used segments once the cache is over CACHE_MAX_BYTES."""
+    if not _evict_lock.acquire(blocking=False):
+        # another thread is already evicting
+        return
+    try:
+        entries = []
+        total = 0
+        for root, _, files in os.walk(CACHE_DIR):
+            for name in files:
+                if not name.endswith('.mp3'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= CACHE_MAX_BYTES:
+            return
+
+        # evict down to 90% so we do not walk the directory again on the next write
+        entries.sort()
+        for _, size, path in entries:
+            if total <= CACHE_MAX_BYTES * 0.9:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+    finally:
+        _evict_lock.release()